@@ -1,23 +1,113 @@
 """
 App Module
 
-It is the one where I declare and start the execution of the
-thread pool executor. It is also the place where I initiate the
-data ingestor and where I start counting the job counter
+It is the one where I declare the webserver. The thread pool executor
+and the data ingestor are created when they are first used (by the first
+request) or when the server is started explicitly, so importing the app
+(tests, benchmarks, worker processes or the master of a pre-fork server)
+doesn't load the CSV file or start threads.
+
+A pre-fork server calls 'preload' in its master process, so the dataset
+and its indexes are loaded once and shared copy-on-write by the workers,
+which start their own thread pool with their first request.
 """
 
+import os
+from threading import RLock
 from flask import Flask
 from app.data_ingestor import DataIngestor
 from app.task_runner import ThreadPool
+from app.dataset_reloader import DatasetReloader
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+class Webserver(Flask):
+    """Class of the application, which creates its state when it is first used"""
+    def __init__(self, import_name, csv_path=CSV_PATH):
+        """Method that initiates the application without loading anything"""
+        super().__init__(import_name)
+        self.csv_path = os.getenv("DATASET_PATH", csv_path)
+        self.init_lock = RLock()
+        self._data_ingestor = None
+        self._tasks_runner = None
+
+        # Reload the dataset on request, or when the file changes
+        # if DATASET_WATCH_INTERVAL is set
+        self.dataset_reloader = DatasetReloader(self)
+
+        # Answer the requests whose answers are known when they are posted
+        self.fast_path = bool(os.getenv("FAST_PATH"))
+
+        # Maximum number of seconds a client can wait for a result
+        self.results_max_wait = float(os.getenv("RESULTS_MAX_WAIT", "30"))
+
+        # Seconds between the keep-alive messages of a stream of results
+        self.stream_keep_alive = float(os.getenv("STREAM_KEEP_ALIVE", "15"))
+
+        # The routes that change the dataset are only served if ADMIN_ROUTES is set
+        self.admin_routes = bool(os.getenv("ADMIN_ROUTES"))
+
+        # Maximum number of questions in a batch
+        self.batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+    @property
+    def data_ingestor(self):
+        """Data ingestor of the dataset, loaded when it is first used"""
+        if self._data_ingestor is None:
+            self.preload(build_index=False)
+        return self._data_ingestor
+
+    @data_ingestor.setter
+    def data_ingestor(self, data_ingestor):
+        self._data_ingestor = data_ingestor
+
+    @property
+    def tasks_runner(self):
+        """Thread pool of the jobs, started when it is first used"""
+        if self._tasks_runner is None:
+            self.start()
+        return self._tasks_runner
+
+    # Load the dataset without starting any thread. With build_index,
+    # the indexes of all the questions are built as well, so forked
+    # workers don't build them again
+    def preload(self, build_index=True):
+        """Method that loads the dataset"""
+        with self.init_lock:
+            if self._data_ingestor is None:
+                self._data_ingestor = DataIngestor(self.csv_path)
+            if build_index:
+                self._data_ingestor.build_index()
+        return self
+
+    # Start the thread pool and the watcher of the dataset. It runs
+    # in each worker process of a pre-fork server, after the fork
+    def start(self):
+        """Method that starts the thread pool"""
+        with self.init_lock:
+            if self._tasks_runner is not None:
+                return self
+
+            self.preload(build_index=False)
 
-webserver = Flask(__name__)
+            tasks_runner = ThreadPool()
+            tasks_runner.start()
+            self._tasks_runner = tasks_runner
 
-webserver.tasks_runner = ThreadPool()
+            if os.getenv("DATASET_WATCH_INTERVAL"):
+                self.dataset_reloader.watch(float(os.getenv("DATASET_WATCH_INTERVAL")))
+        return self
 
-webserver.tasks_runner.start()
+    def is_started(self):
+        """Method that checks if the thread pool was started"""
+        return self._tasks_runner is not None
 
-webserver.data_ingestor = DataIngestor("./nutrition_activity_obesity_usa_subset.csv")
+webserver = Webserver(__name__)
 
-webserver.job_counter = 1
+# Load the dataset and start the thread pool right away,
+# instead of with the first request
+def create_app():
+    """Function that returns the started application"""
+    return webserver.start()
 
 from app import routes
@@ -1,27 +1,241 @@
 """
 Data Ingestor Module
 
-This module contains a class `DataIngestor` that represents a data handler. 
+This module contains a class `DataIngestor` that represents a data handler.
 It provides methods to read CSV data and answer questions based on the data.
+
+It also contains the 'QuestionIndex' class, which holds the aggregates of a
+single question (by state and by state, category and stratification), so a
+question is filtered and grouped only once and every later request for it
+is answered from the precomputed tables.
+
+With DATASET_CHUNK_ROWS set, the CSV file is read in chunks of that many
+rows and only the sum and the count of the values of each (question, state,
+stratification, category) are kept, so the memory used grows with the number
+of groups instead of the number of rows. The indexes are then built from
+these sums, so the means can differ from the ones of the whole table in the
+last digits.
+
+Rows can be appended to a loaded dataset, which gives a new data ingestor:
+only the sums and counts of their groups are added to the indexes of their
+questions, and only these questions get a new version, so the cached answers
+of the other questions stay valid.
 """
+import copy
+import itertools
+import os
+from threading import Lock
+import numpy as np
 import pandas as pd
+from app.dataset_cache import load_frame
+
+# Types of questions that can be answered
+QUESTION_TYPES = ("states_mean", "state_mean", "best5", "worst5", "global_mean",
+                  "diff_from_mean", "state_diff_from_mean", "mean_by_category",
+                  "state_mean_by_category", "top_k")
+
+# Orders of the states of top_k
+RANKING_ORDERS = ("best", "worst")
+
+# Each loaded dataset gets the next version
+DATASET_VERSIONS = itertools.count(1)
+
+# Columns used by the questions, the other columns are not loaded
+STRING_COLUMNS = ['Question', 'LocationDesc', 'StratificationCategory1', 'Stratification1']
+VALUE_COLUMN = 'Data_Value'
+
+# Groups of the sums kept when the file is read in chunks
+GROUP_COLUMNS = ['Question', 'LocationDesc', 'Stratification1', 'StratificationCategory1']
+
+# Read the columns used by the questions from the CSV file. The text
+# columns are categorical, so comparisons and groupbys work on integer
+# codes, and the values are float64
+def read_csv(csv_path):
+    """Function that reads the used columns of the CSV file"""
+    return pd.read_csv(csv_path, usecols=STRING_COLUMNS + [VALUE_COLUMN],
+                       dtype={**dict.fromkeys(STRING_COLUMNS, "category"),
+                              VALUE_COLUMN: np.float64})
+
+# Sum and count of the values of each group of the rows of a frame
+def group_sums(frame):
+    """Function that returns the sums and counts of the groups of a frame"""
+    return frame.groupby(GROUP_COLUMNS, sort=False)[VALUE_COLUMN].agg(["sum", "count"])
+
+# Add two frames of sums, groups that are in both get the
+# sum of their sums and counts
+def add_sums(sums, other):
+    """Function that adds the sums and counts of two frames"""
+    return pd.concat([sums, other]).groupby(level=list(sums.index.names), sort=False).sum()
+
+# Read the CSV file chunk_rows rows at a time and return the sum and the
+# count of the values of each group. The sums of each chunk are added to
+# the sums of the previous chunks, and the rows of the chunk are dropped
+def read_sums(csv_path, chunk_rows):
+    """Function that reads the sums and counts of the groups of the CSV file"""
+    sums = None
+    for chunk in pd.read_csv(csv_path, usecols=STRING_COLUMNS + [VALUE_COLUMN],
+                             dtype={**dict.fromkeys(STRING_COLUMNS, str),
+                                    VALUE_COLUMN: np.float64},
+                             chunksize=chunk_rows):
+        part = group_sums(chunk)
+        sums = part if sums is None else add_sums(sums, part)
+
+    if sums is None:
+        sums = pd.DataFrame({"sum": pd.Series(dtype=np.float64),
+                             "count": pd.Series(dtype=np.int64)},
+                            index=pd.MultiIndex.from_tuples([], names=GROUP_COLUMNS))
+
+    # Sorted, so the groups of a question are a single slice
+    return sums.sort_index()
+
+class QuestionIndex:
+    """Class that holds the precomputed aggregates of a question"""
+
+    def __init__(self, table):
+        """Method that computes the aggregates from the rows of a question"""
+        values = table["Data_Value"]
+
+        # Sum, count and mean of each state
+        by_state = table.groupby("LocationDesc", observed=True)["Data_Value"]
+        self.state_sum = by_state.sum()
+        self.state_count = by_state.count()
+        self.set_state_means(by_state.mean())
+
+        # Sum, count and mean of the whole question
+        self.global_sum = values.sum()
+        self.global_count = values.count()
+        self.global_mean = values.mean()
+
+        # Sum, count and mean of each (state, stratification, category)
+        by_category = table.groupby(['LocationDesc', 'Stratification1',
+                                     'StratificationCategory1'], observed=True)['Data_Value']
+        self.category_sum = by_category.sum()
+        self.category_count = by_category.count()
+        self.set_category_means(by_category.mean())
+
+    # Build the index from the sum and the count of the values of each
+    # (state, stratification, category) of the question, see read_sums
+    @classmethod
+    def from_sums(cls, sums):
+        """Method that computes the aggregates from the sums of a question"""
+        index = cls.__new__(cls)
+
+        # Sum, count and mean of each state
+        by_state = sums.groupby(level="LocationDesc")
+        index.state_sum = by_state["sum"].sum()
+        index.state_count = by_state["count"].sum()
+        index.set_state_means(index.state_sum / index.state_count)
+
+        # Sum, count and mean of the whole question
+        index.global_sum = sums["sum"].sum()
+        index.global_count = sums["count"].sum()
+        index.global_mean = index.global_sum / index.global_count \
+            if index.global_count else np.nan
+
+        # Sum, count and mean of each (state, stratification, category)
+        category_sums = sums.reorder_levels(['LocationDesc', 'Stratification1',
+                                             'StratificationCategory1'])
+        index.category_sum = category_sums["sum"]
+        index.category_count = category_sums["count"]
+        index.set_category_means(index.category_sum / index.category_count)
+        return index
+
+    # A new index with the sums of new rows of the question added to the
+    # sums of this one, the index itself is not changed since running
+    # jobs can still use it. Only the groups of the question are added
+    def with_sums(self, sums):
+        """Method that returns the index with the sums of new rows added"""
+        category_sums = pd.DataFrame({"sum": self.category_sum, "count": self.category_count})
+        return QuestionIndex.from_sums(add_sums(category_sums, sums).sort_index())
+
+    # Keep the means of the states in the forms used by the answers
+    def set_state_means(self, states_mean):
+        """Method that creates the lists and dicts of the means by state"""
+        self.states_mean = states_mean
+
+        # States sorted by their mean and a dict used for
+        # getting the mean of a single state in O(1)
+        self.sorted_states = sorted(states_mean.items(), key=lambda item: item[1])
+        self.state_means = dict(states_mean.items())
+
+        # Rankings of the states from the lowest and from the highest
+        # mean, sorted like the answers of best5 and worst5 always were,
+        # so the first k states of a ranking are a slice
+        self.ascending_states = list(states_mean.sort_values(ascending=True).items())
+        self.descending_states = list(states_mean.sort_values(ascending=False).items())
+
+    # Create the answers of mean_by_category and of state_mean_by_category
+    # from the means of each (state, stratification, category). The keys
+    # are built for all rows at once and the means are split by state, so
+    # a request for a state only looks up its own dict
+    def set_category_means(self, mean):
+        """Method that creates the dicts of the means by category"""
+        locations = mean.index.get_level_values('LocationDesc').astype(str)
+        infos = mean.index.get_level_values('Stratification1').astype(str)
+        categories = mean.index.get_level_values('StratificationCategory1').astype(str)
+        values = mean.tolist()
+
+        # Keys like "('Alabama', 'Age (years)', '18 - 24')"
+        keys = "('" + locations + "', '" + categories + "', '" + infos + "')"
+        self.category_means = dict(zip(keys, values))
+
+        # Keys like "('Age (years)', '18 - 24')" for each state
+        state_keys = np.asarray("('" + categories + "', '" + infos + "')", dtype=object)
+        self.state_category_means = {}
+        for location, positions in pd.Series(locations).groupby(locations).indices.items():
+            self.state_category_means[location] = dict(zip(state_keys[positions],
+                                                           [values[i] for i in positions]))
 
 class DataIngestor:
     """Class representing a data handler that gets a question and returns an answer"""
 
-    def __init__(self, csv_path: str):
-        # Read csv from csv_path
-        self.csv_data = pd.read_csv(csv_path)
+    def __init__(self, csv_path: str, chunk_rows=None):
+        self.csv_path = csv_path
+        self.version = next(DATASET_VERSIONS)
+        self.version_loaded = self.version
 
-        self.questions_best_is_min = [
+        if chunk_rows is None and os.getenv("DATASET_CHUNK_ROWS"):
+            chunk_rows = int(os.getenv("DATASET_CHUNK_ROWS"))
+
+        if chunk_rows:
+            # Keep only the sums of the groups, see read_sums
+            self.csv_data = None
+            self.sums = read_sums(csv_path, chunk_rows)
+            self.file_questions = set(self.sums.index.unique(level="Question"))
+        else:
+            # Read csv from csv_path, or its binary snapshot if it was
+            # already parsed, see read_csv
+            self.csv_data = load_frame(csv_path, read_csv)
+            self.sums = None
+            self.file_questions = set(self.csv_data['Question'].cat.categories)
+
+        # Questions that exist in the file or in the appended
+        # rows, only these get an index
+        self.questions = self.file_questions
+
+        # Sums of the appended rows, see append_sums, the version of
+        # the dataset the last rows were appended to with their sums
+        # and the version of the dataset in which each question last changed
+        self.appended = None
+        self.last_append = None
+        self.appended_values = 0
+        self.question_versions = {}
+
+        # Aggregates of each question, built on the first request
+        self.question_index = {}
+        self.index_lock = Lock()
+
+        # Questions whose best states have the lowest means, for
+        # the others the best states have the highest means
+        self.questions_best_is_min = {
             'Percent of adults aged 18 years and older who have an overweight classification',
             'Percent of adults aged 18 years and older who have obesity',
             'Percent of adults who engage in no leisure-time physical activity',
             'Percent of adults who report consuming fruit less than one time daily',
             'Percent of adults who report consuming vegetables less than one time daily'
-        ]
+        }
 
-        self.questions_best_is_max = [
+        self.questions_best_is_max = {
             'Percent of adults who achieve at least 150 minutes a week of '
             'moderate-intensity aerobic physical activity or '
             '75 minutes a week of '
@@ -38,18 +252,153 @@ class DataIngestor:
             'activity (or an equivalent combination)',
             'Percent of adults who engage in muscle-strengthening activities '
             'on 2 or more days a week',
-        ]
+        }
+
+    # Get the index of a question, building it the first time
+    # the question is asked. Questions that are not in the file
+    # get an empty index which is not stored, so random questions
+    # can't fill the memory
+    def get_index(self, question):
+        """Method that returns the aggregates of a question"""
+        index = self.question_index.get(question)
+        if index is not None:
+            return index
+
+        if question not in self.questions:
+            return self.read_index(None)
+
+        with self.index_lock:
+            # Another thread could have built it in the meantime
+            index = self.question_index.get(question)
+            if index is None:
+                index = self.read_index(question)
+                if self.appended is not None and question in self.appended.index:
+                    index = index.with_sums(self.appended.loc[question])
+                self.question_index[question] = index
+
+        return index
+
+    # Build the index of a question from the rows of the file, or
+    # from the sums of its groups if the file was read in chunks
+    def read_index(self, question):
+        """Method that builds the index of a question from the file"""
+        if self.sums is not None:
+            if question not in self.file_questions:
+                return QuestionIndex.from_sums(self.sums.iloc[0:0].droplevel("Question"))
+            return QuestionIndex.from_sums(self.sums.loc[question])
+
+        if question not in self.file_questions:
+            return QuestionIndex(self.csv_data.iloc[0:0])
+        return QuestionIndex(self.csv_data[self.csv_data['Question'] == question])
+
+    # Version of the dataset the answers of a question belong to, it
+    # only changes when rows of the question are appended
+    def question_version(self, question):
+        """Method that returns the version of the data of a question"""
+        return self.question_versions.get(question, self.version_loaded)
+
+    # Add the rows of a list of dicts (or of a frame) with the
+    # columns used by the questions, see append_sums. The text columns
+    # must be non-empty strings, since the groups of the rows with a
+    # missing one would be dropped and other values would become new
+    # questions or states
+    def append(self, rows):
+        """Method that returns the dataset with rows appended"""
+        frame = pd.DataFrame(rows)
+        missing = [column for column in STRING_COLUMNS + [VALUE_COLUMN]
+                   if column not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+        for column in STRING_COLUMNS:
+            if not frame[column].map(lambda value: isinstance(value, str) and value != "").all():
+                raise ValueError(f"Invalid values in column {column}")
+        frame[VALUE_COLUMN] = pd.to_numeric(frame[VALUE_COLUMN]).astype(np.float64)
+        return self.append_sums(group_sums(frame))
+
+    # Add the rows of a CSV file with the columns of the dataset
+    def append_csv(self, csv_path, chunk_rows=100000):
+        """Method that returns the dataset with the rows of a CSV file appended"""
+        return self.append_sums(read_sums(csv_path, chunk_rows))
+
+    # Add the sums of new rows (see group_sums) to a copy of the dataset.
+    # The copy shares the rows (or the sums) of the file and gets its own
+    # dict of indexes: the indexes of the questions of the rows that were
+    # already built get the sums added to theirs, the others add them when
+    # they are built, so nothing is computed again from the rows. This data
+    # ingestor is not changed, so the jobs that use it finish with the old
+    # data. Only these questions get the new version. Returns the new data
+    # ingestor and the changed questions
+    def append_sums(self, sums):
+        """Method that returns the dataset with the sums of new rows added"""
+        questions = set(sums.index.unique(level="Question"))
+        data_ingestor = copy.copy(self)
+
+        with self.index_lock:
+            question_index = dict(self.question_index)
+
+        for question in questions:
+            index = question_index.get(question)
+            if index is not None:
+                question_index[question] = index.with_sums(sums.loc[question])
+
+        data_ingestor.question_index = question_index
+        data_ingestor.index_lock = Lock()
+        data_ingestor.appended = sums if self.appended is None else add_sums(self.appended, sums)
+        data_ingestor.last_append = (self.version, sums)
+        data_ingestor.questions = self.questions | questions
+        data_ingestor.appended_values = self.appended_values + int(sums["count"].sum())
+
+        # The workers of a process executor are started again for the new version
+        data_ingestor.version = next(DATASET_VERSIONS)
+        data_ingestor.question_versions = {**self.question_versions,
+                                           **dict.fromkeys(questions, data_ingestor.version)}
+
+        return data_ingestor, sorted(questions)
+
+    # States of a question from the best to the worst (or from the
+    # worst to the best), which only depends on the question
+    def ranking(self, question, index, order="best"):
+        """Method that returns the ranking of the states of a question"""
+        if (question in self.questions_best_is_min) == (order == "best"):
+            return index.ascending_states
+        return index.descending_states
+
+    # Check if the answers of a question are already precomputed
+    def is_indexed(self, question):
+        """Method that checks if a question has an index"""
+        return isinstance(question, str) and question in self.question_index
+
+    # Build the index of every question at once
+    def build_index(self):
+        """Method that precomputes the aggregates of all questions"""
+        for question in self.questions:
+            self.get_index(question)
+
+    # Answer every item of a batch, in the order of the items
+    # Items about the same question use the same index, so each
+    # question is filtered and grouped at most once
+    def answer_batch(self, items):
+        """Method that answers a list of questions"""
+        results = []
+        for item in items:
+            results.append({"type": item["type"], "question": item["question"],
+                            "state": item.get("state"),
+                            "data": self.answer_question(item, item["type"])})
+        return results
 
-    # Get all table lines from the file that
-    # satisfy the given question
     def answer_question(self, data, question_type):
         """Method that gets question and answes it"""
 
+        # A batch holds a list of questions
+        if question_type == "batch":
+            return self.answer_batch(data["items"])
+
         # Extract question from json
         question = data['question']
 
-        # Filter table based on the question
-        table = self.csv_data[self.csv_data['Question'] == question]
+        # Get the precomputed aggregates of the question
+        index = self.get_index(question)
 
         results = {}
 
@@ -59,67 +408,41 @@ class DataIngestor:
         # This dictionary will represent the data that I will return
         # when I try to get a result for a certain job_id
         if question_type == "states_mean":
-            mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            results = dict(sorted(mean.items(), key=lambda item: item[1]))
+            results = dict(index.sorted_states)
 
         elif question_type == "state_mean":
             state = data['state']
-            mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            results = {k: v for k, v in
-                       sorted(mean.items(), key=lambda item: item[1]) if k == state}
+            if state in index.state_means:
+                results = {state: index.state_means[state]}
 
         elif question_type == "best5":
-            mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            results = dict(mean.sort_values(ascending=question
-                                            in self.questions_best_is_min).head(5))
+            results = dict(self.ranking(question, index, "best")[:5])
 
         elif question_type == "worst5":
-            mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            results = dict(mean.sort_values(ascending=question
-                                            not in self.questions_best_is_min).head(5))
+            results = dict(self.ranking(question, index, "worst")[:5])
+
+        elif question_type == "top_k":
+            # The k best (or worst) states, 5 best by default
+            order = data.get("order", "best")
+            results = dict(self.ranking(question, index, order)[:data.get("k", 5)])
 
         elif question_type == "global_mean":
-            mean = table["Data_Value"].mean()
-            results = {'global_mean': mean}
+            results = {'global_mean': index.global_mean}
 
         elif question_type == "diff_from_mean":
-            states_mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            global_mean = table["Data_Value"].mean()
-            results = {k: global_mean - v for k, v in
-                       sorted(states_mean.items(), key=lambda item: item[1])}
+            global_mean = index.global_mean
+            results = {k: global_mean - v for k, v in index.sorted_states}
 
         elif question_type == "state_diff_from_mean":
             state = data['state']
-            states_mean = table.groupby("LocationDesc")["Data_Value"].mean()
-            global_mean = table["Data_Value"].mean()
-            results = {k: global_mean - v for k, v in
-                       sorted(states_mean.items(), key=lambda item: item[1]) if k == state}
+            if state in index.state_means:
+                results = {state: index.global_mean - index.state_means[state]}
 
         elif question_type == "mean_by_category":
-            mean = table.groupby(['LocationDesc', 'Stratification1', 'StratificationCategory1']) \
-                    ['Data_Value'].mean().reset_index()
-
-            for _, row in mean.iterrows():
-                location = row['LocationDesc']
-                info = row['Stratification1']
-                category = row['StratificationCategory1']
-                value = row['Data_Value']
-                key = f"('{location}', '{category}', '{info}')"
-                results[key] = value
+            results = dict(index.category_means)
 
         else:
-            temp_dict = {}
             state = data['state']
-            mean = table.groupby(['LocationDesc', 'Stratification1', 'StratificationCategory1']) \
-                    ['Data_Value'].mean().reset_index()
-            for _, row in mean.iterrows():
-                location = row['LocationDesc']
-                if location == state:
-                    info = row['Stratification1']
-                    category = row['StratificationCategory1']
-                    value = row['Data_Value']
-                    key = f"('{category}', '{info}')"
-                    temp_dict[key] = value
-            results[state] = temp_dict
+            results[state] = dict(index.state_category_means.get(state, {}))
 
         return results
@@ -0,0 +1,121 @@
+"""
+Dataset Cache Module
+
+This module keeps a binary snapshot of the parsed dataset next to the CSV
+file, so the next start of the server doesn't parse the CSV again.
+
+A snapshot is a folder with one `.npy` file for the integer codes of each
+categorical column, one `.npy` file for each numeric column and a JSON file
+with the categories. The `.npy` files are memory mapped when the snapshot
+is loaded, so loading it only reads the pages that are used.
+
+The name of the snapshot contains the size and the modification time of
+the CSV file (and the SHA-1 of its content if DATASET_CACHE_HASH is set),
+so a snapshot of an older version of the file is never loaded. Snapshots
+are written in DATASET_CACHE_DIR (by default `.dataset_cache` in the folder
+of the CSV file) and DATASET_CACHE=0 disables them.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+CATEGORIES_FILE = "categories.json"
+
+# Name of the snapshot of a CSV file, made from its name, size,
+# modification time and, if requested, the hash of its content
+def snapshot_path(csv_path):
+    """Function that returns the folder of the snapshot of a CSV file"""
+    stat = os.stat(csv_path)
+    key = f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    if os.getenv("DATASET_CACHE_HASH"):
+        digest = hashlib.sha1()
+        with open(csv_path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        key += "-" + digest.hexdigest()
+
+    cache_dir = os.getenv("DATASET_CACHE_DIR") or \
+        os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".dataset_cache")
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+
+    return os.path.join(cache_dir, f"{name}@{key}")
+
+# Write the snapshot in a temporary folder which is then renamed, so a
+# snapshot is either complete or missing. Older snapshots of the same
+# file are removed
+def write_snapshot(frame, path):
+    """Function that writes the snapshot of a frame"""
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = tempfile.mkdtemp(dir=cache_dir)
+
+    try:
+        categories = {}
+        for column in frame.columns:
+            values = frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories[column] = values.cat.categories.tolist()
+                np.save(os.path.join(temp_path, column + ".npy"), values.cat.codes.to_numpy())
+            else:
+                np.save(os.path.join(temp_path, column + ".npy"), values.to_numpy())
+
+        with open(os.path.join(temp_path, CATEGORIES_FILE), "w", encoding="utf-8") as file:
+            json.dump({"columns": list(frame.columns), "categories": categories}, file)
+
+        os.replace(temp_path, path)
+    except OSError:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+    # Remove the snapshots of older versions of the file
+    prefix = os.path.basename(path).rsplit("@", 1)[0] + "@"
+    for other in os.listdir(cache_dir):
+        other_path = os.path.join(cache_dir, other)
+        if other.startswith(prefix) and other_path != path and os.path.isdir(other_path):
+            shutil.rmtree(other_path, ignore_errors=True)
+
+def read_snapshot(path):
+    """Function that reads a snapshot, memory mapping its arrays"""
+    with open(os.path.join(path, CATEGORIES_FILE), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+
+    columns = {}
+    for column in meta["columns"]:
+        values = np.load(os.path.join(path, column + ".npy"), mmap_mode="r")
+        if column in meta["categories"]:
+            columns[column] = pd.Categorical.from_codes(values, meta["categories"][column])
+        else:
+            columns[column] = values
+
+    return pd.DataFrame(columns, copy=False)
+
+# Load the frame from the snapshot of the CSV file if there is one,
+# otherwise parse it with read_csv and write its snapshot
+# Any problem with the snapshot falls back to parsing the CSV file
+def load_frame(csv_path, read_csv):
+    """Function that loads a frame from its snapshot or from the CSV file"""
+    if os.getenv("DATASET_CACHE", "1") == "0":
+        return read_csv(csv_path)
+
+    try:
+        path = snapshot_path(csv_path)
+    except OSError:
+        return read_csv(csv_path)
+
+    if os.path.isdir(path):
+        try:
+            return read_snapshot(path)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    frame = read_csv(csv_path)
+    try:
+        write_snapshot(frame, path)
+    except OSError:
+        pass
+    return frame
@@ -0,0 +1,154 @@
+"""
+Dataset Reloader Module
+
+This module contains the 'DatasetReloader' class that replaces the dataset
+of the server without restarting it. The new CSV file is loaded and indexed
+in a background thread and then the data ingestor of the server is swapped
+in a single assignment. Jobs keep the data ingestor they were created with,
+so the jobs that are already running finish with the old dataset.
+
+Every data ingestor has its own version, which is part of the keys of the
+result cache, so answers of the old dataset are never returned for the new
+one. The cache is also cleared after the swap.
+
+Rows can also be appended to the current dataset, from a list of rows or
+from a CSV file with the new rows only. A new data ingestor is built with
+their sums added to the indexes of their questions (see
+'DataIngestor.append_sums') and swapped like a reload, then only the cached
+answers of these questions are removed. The appended rows are kept in
+memory, a reload reads the file again without them.
+
+A client can only name a file of the data folder (DATASET_DIR, by default
+the folder of the dataset), see 'resolve_path'. When a load fails, only the
+name of the file is kept in the state, the error itself is logged.
+
+With DATASET_WATCH_INTERVAL set, the reloader checks the CSV file every
+given number of seconds and reloads it when its size or its modification
+time change.
+"""
+import os
+import time
+from threading import Thread, Lock, Event
+from app.data_ingestor import DataIngestor
+from app.webserver_logger import logger, error_logger
+
+class DatasetReloader:
+    """Class that reloads the dataset of the server in the background"""
+    def __init__(self, server):
+        """Method that initiates the reloader of the server"""
+        self.server = server
+        self.data_dir = os.path.realpath(os.getenv("DATASET_DIR") or
+                                         os.path.dirname(os.path.abspath(server.csv_path)))
+        self.state = "idle"
+        self.error = None
+        self.loaded_at = time.time()
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.watcher = None
+
+    # Path of a file named by a client, relative to the data folder.
+    # Raises ValueError if it is not a file of the data folder
+    def resolve_path(self, path):
+        """Method that returns the full path of a file of the data folder"""
+        full_path = os.path.realpath(os.path.join(self.data_dir, path))
+        if os.path.commonpath([self.data_dir, full_path]) != self.data_dir \
+                or not os.path.isfile(full_path):
+            raise ValueError("Invalid path")
+        return full_path
+
+    # Start loading the CSV file from path, or the current file
+    # if no path is given. Returns False if a reload is running
+    def reload(self, path=None):
+        """Method that starts reloading the dataset"""
+        with self.lock:
+            if self.state == "loading":
+                return False
+            self.state = "loading"
+
+        if path is None:
+            path = self.server.data_ingestor.csv_path
+
+        Thread(target=self._load, args=(path,), daemon=True).start()
+        return True
+
+    def _load(self, path):
+        """Method that loads and swaps the dataset, runs in its own thread"""
+        try:
+            data_ingestor = DataIngestor(path)
+
+            # Build the indexes before the swap,
+            # so the first requests are not slower
+            data_ingestor.build_index()
+
+            # Swap the data ingestor, new jobs use the new one
+            self.server.data_ingestor = data_ingestor
+            self.server.tasks_runner.result_cache.clear()
+
+            with self.lock:
+                self.state = "idle"
+                self.error = None
+                self.loaded_at = time.time()
+            logger.info("Loaded dataset %s, version %d", path, data_ingestor.version)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            with self.lock:
+                self.state = "error"
+                self.error = f"Could not load {os.path.basename(path)}"
+            error_logger.error({"status": "error", "reason": f"Reload failed: {e}"})
+
+    # Append a list of rows, or the rows of the CSV file at path, to the
+    # dataset. Returns the new version and the changed questions, or None
+    # if a reload is running, since the new dataset wouldn't have the rows.
+    # Invalid rows raise ValueError and a missing file raises OSError
+    def append(self, rows=None, path=None):
+        """Method that appends rows to the dataset"""
+        with self.lock:
+            if self.state == "loading":
+                return None
+
+            if path is not None:
+                data_ingestor, questions = self.server.data_ingestor.append_csv(path)
+            else:
+                data_ingestor, questions = self.server.data_ingestor.append(rows)
+
+            # Swap the data ingestor, new jobs see the appended rows
+            self.server.data_ingestor = data_ingestor
+
+        self.server.tasks_runner.result_cache.invalidate(questions)
+        logger.info("Appended rows of %d questions, version %d",
+                    len(questions), data_ingestor.version)
+        return {"version": data_ingestor.version, "questions": questions}
+
+    def status(self):
+        """Method that returns the state of the dataset"""
+        data_ingestor = self.server.data_ingestor
+        with self.lock:
+            return {"path": data_ingestor.csv_path, "version": data_ingestor.version,
+                    "appended_values": data_ingestor.appended_values,
+                    "state": self.state, "error": self.error, "loaded_at": self.loaded_at}
+
+    # Check the file of the dataset every interval seconds
+    # and reload it when it changes
+    def watch(self, interval):
+        """Method that starts watching the file of the dataset"""
+        self.watcher = Thread(target=self._watch, args=(interval,), daemon=True)
+        self.watcher.start()
+
+    def _watch(self, interval):
+        """Method that watches the file of the dataset, runs in its own thread"""
+        last = None
+        while not self.stop_event.wait(interval):
+            path = self.server.data_ingestor.csv_path
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            # If a reload is already running, the change
+            # is seen again at the next check
+            current = (path, stat.st_size, stat.st_mtime_ns)
+            if last is None or current == last or self.reload(path):
+                last = current
+
+    def stop(self):
+        """Method that stops watching the file of the dataset"""
+        self.stop_event.set()
@@ -0,0 +1,190 @@
+"""
+Executors Module
+
+This module contains the executors used by the task runners to compute the
+answer of a task. An executor returns the answer as JSON text.
+
+'LocalExecutor' computes the answer in the thread of the task runner.
+
+'ProcessExecutor' sends the task to a pool of worker processes, so the
+pandas work doesn't hold the GIL of the server. The workers are started
+with forkserver (or spawn where it is not available) and each of them loads
+the CSV once when it starts. Forking the server itself is not safe, since its
+threads (task runners, logger, reloader) could hold a lock at the time of the
+fork, so fork is only used when TP_START_METHOD=fork is set; the workers then
+share the pages of the parent's data ingestor copy-on-write.
+When the dataset is reloaded, new workers are started for the new file
+and the old ones stop after finishing the tasks they already got. Rows
+appended to the dataset are sent to the running workers with the next tasks,
+so the workers only add their sums and don't load the file again.
+
+'create_executor' builds the executor set by TP_EXECUTOR.
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from app.extra import serialize_result
+
+# Data ingestor of the file loaded by a worker process, the one with
+# the appended rows and the version it has in the server process
+WORKER_BASE = None
+WORKER_INGESTOR = None
+WORKER_VERSION = None
+
+# Runs in each worker process when it starts. A forked worker
+# already has the ingestor of the parent, if it had no appended rows
+def init_worker(csv_path, version):
+    """Function that loads the dataset in a worker process"""
+    global WORKER_BASE, WORKER_INGESTOR, WORKER_VERSION # pylint: disable=global-statement
+
+    if WORKER_BASE is None:
+        # pylint: disable=import-outside-toplevel
+        from app.data_ingestor import DataIngestor
+        WORKER_BASE = DataIngestor(csv_path)
+    WORKER_INGESTOR = WORKER_BASE
+    WORKER_VERSION = version
+
+# Runs in a worker process, the answer is serialized there so the parent
+# only receives a string. The rows appended since the worker started are
+# sent with the tasks: update is the version the rows were appended to and
+# their sums, so a worker that has that version only adds these sums, and
+# a version of None means the sums of all appended rows, which are added to
+# the dataset of the file. Returns None if the worker can't use the update
+def answer_in_worker(data, question_type, version, update=None):
+    """Function that answers a question in a worker process"""
+    global WORKER_INGESTOR, WORKER_VERSION # pylint: disable=global-statement
+
+    if version != WORKER_VERSION:
+        if update is None:
+            return None
+        if update[0] is None:
+            WORKER_INGESTOR = WORKER_BASE
+        elif update[0] != WORKER_VERSION:
+            return None
+        if update[1] is not None:
+            WORKER_INGESTOR, _ = WORKER_INGESTOR.append_sums(update[1])
+        WORKER_VERSION = version
+
+    return serialize_result(WORKER_INGESTOR.answer_question(data, question_type))
+
+class LocalExecutor:
+    """Class that computes the answers in the calling thread"""
+    def run(self, task):
+        """Method that returns the JSON text of the answer of a task"""
+        result = task.execute()
+
+        start = time.perf_counter()
+        text = serialize_result(result)
+        task.timings["serialize"] = time.perf_counter() - start
+        return text
+
+    def shutdown(self):
+        """Method that stops the executor"""
+
+class ProcessExecutor:
+    """Class that computes the answers in worker processes"""
+    def __init__(self, num_workers, start_method=None):
+        """Method that initiates the executor, the workers start with the first task"""
+        if start_method is None:
+            start_method = os.getenv("TP_START_METHOD")
+        if start_method is None:
+            start_method = "forkserver" \
+                if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+        self.num_workers = num_workers
+        self.context = multiprocessing.get_context(start_method)
+        self.pool = None
+        self.pool_version = None
+        self.lock = Lock()
+
+    # Create the pool of workers. The ingestor of the task is set as
+    # the ingestor of the workers before they are forked. Appended rows
+    # don't replace the pool, they are sent to the workers with the tasks,
+    # only a task of a newer file replaces the pool and a task of an older
+    # file than the pool gets None
+    def _get_pool(self, data_ingestor):
+        """Method that returns the pool of workers, creating it if needed"""
+        global WORKER_BASE # pylint: disable=global-statement
+
+        with self.lock:
+            if self.pool is not None and self.pool_version == data_ingestor.version_loaded:
+                return self.pool
+
+            if self.pool is not None and self.pool_version > data_ingestor.version_loaded:
+                return None
+
+            # The old workers finish the tasks they already got
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+
+            # A forked worker can only start from an ingestor without
+            # appended rows, the others load the file
+            WORKER_BASE = None
+            if self.context.get_start_method() == "fork" and data_ingestor.appended is None:
+                WORKER_BASE = data_ingestor
+            self.pool = ProcessPoolExecutor(self.num_workers, mp_context=self.context,
+                                            initializer=init_worker,
+                                            initargs=(data_ingestor.csv_path,
+                                                      data_ingestor.version_loaded))
+            self.pool_version = data_ingestor.version_loaded
+            return self.pool
+
+    # The worker gets the rows appended to the dataset since the version it
+    # has. If it missed some of them, it gets all the appended rows
+    def run(self, task):
+        """Method that returns the JSON text of the answer of a task"""
+        data_ingestor = task.data_ingestor
+        text = self._run_in_pool(task, data_ingestor.last_append)
+
+        if text is None:
+            text = self._run_in_pool(task, (None, data_ingestor.appended))
+        return text
+
+    # Wait for the answer of a worker. If a worker died, the pool
+    # can't be used anymore, so a new one is created for the next task
+    def _run_in_pool(self, task, update):
+        """Method that computes the answer of a task in a worker"""
+        pool = self._get_pool(task.data_ingestor)
+
+        # The workers already use a newer dataset, so the task
+        # is computed here with the dataset it was created with
+        if pool is None:
+            return serialize_result(task.execute())
+
+        try:
+            future = pool.submit(answer_in_worker, task.data, task.type,
+                                 task.data_ingestor.version, update)
+        except RuntimeError:
+            # The pool was replaced by the pool of a newer dataset
+            return serialize_result(task.execute())
+
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = None
+            raise
+
+    def shutdown(self):
+        """Method that stops the worker processes"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+
+# TP_EXECUTOR selects where the answers are computed:
+# "threads" (the default) or "processes"
+def create_executor(num_workers):
+    """Function that creates the executor set in the environment"""
+    backend = os.getenv("TP_EXECUTOR", "threads")
+
+    if backend == "threads":
+        return LocalExecutor()
+    if backend == "processes":
+        return ProcessExecutor(num_workers)
+
+    raise ValueError(f"Unknown executor: {backend}")
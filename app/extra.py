@@ -4,15 +4,17 @@ Extra Module
 This module contains the 'Job' class that handles the execution of
 the task with the given requirements.
 
-It also contains some functions that handle the results folder,
-by creating the path using a job id ('create_path'), writing the result into the
-file with the given job id ('post_result') and reading from the file with 
-the given job id and returning the result ('get_result')
+It also contains the functions that handle the results of the jobs, by
+serializing the result of a job ('serialize_result'), writing its JSON
+text into the result store ('post_result_json') and reading it back from
+the store ('get_result_json')
 """
-import os
 import json
+import time
+from app.result_store import create_result_store
 
-FOLDER_PATH = "results"
+# Store that keeps the results of the finished jobs
+RESULT_STORE = create_result_store()
 
 class Job:
     """Class that handles the execution of a task"""
@@ -23,63 +25,42 @@ class Job:
         self.type = job_type
         self.data = data
         self.data_ingestor = data_ingestor
+        self.cache_key = None
+        self.priority = None
+
+        # Seconds spent in each stage of the job, see app.metrics
+        self.created = time.perf_counter()
+        self.timings = {}
 
     # Get the answer from the data digestor and return it
+    # The index of the question is got first, so the filtering and
+    # grouping of the table are timed apart from building the answer
     def execute(self):
         """Method that executes the given job"""
-        results = self.data_ingestor.answer_question(self.data, self.type)
-        return results
-
-# Create the file path for getting and posting
-# the result in the results folder
-def create_path(job_id):
-    """Function that creates path"""
-    file_name = job_id + ".json"
-    file_path = os.path.join(FOLDER_PATH, file_name)
-
-    return file_path
-
-# This writes the result after the execution of the
-# task in a file with path "results/job_id_{job_id}"
-def post_result(job_id, result):
-    """Function that writes result into the file"""
-    file_path = create_path(job_id)
-    # Check if the folder exists, if not, create it
-    if not os.path.exists(FOLDER_PATH):
-        os.makedirs(FOLDER_PATH)
-
-    # Check if the file exists, if not, create it
-    if not os.path.exists(file_path):
-        with open(file_path, "w", encoding='utf-8') as file:
-            file.close()
+        start = time.perf_counter()
+        question = self.data.get("question") if isinstance(self.data, dict) else None
 
-    # Write into the file
-    data = json.dumps(result)
-    with open(file_path, "a", encoding='utf-8') as file:
-        file.write(data)
+        if self.type != "batch" and isinstance(question, str):
+            self.data_ingestor.get_index(question)
+            self.timings["index"] = time.perf_counter() - start
+            start = time.perf_counter()
 
-# This function returns an empty dict if the job is not done
-# Otherwise, it returns a dict representing the result
-def get_result(job_id):
-    """Function that reads result from file"""
-    file_path = create_path(job_id)
-
-    result = {}
-    # Check if the file exists
-    if os.path.exists(file_path):
-
-        # Read from the file
-        with open(file_path, "r", encoding='utf-8') as file:
-            data = file.read()
-
-            # If data exists, return the result
-            if data:
-                result = json.loads(data)
-
-            # There isn't a case where the file exists
-            # but there is no data in file
-            else:
-                pass
+        results = self.data_ingestor.answer_question(self.data, self.type)
+        self.timings["answer"] = time.perf_counter() - start
+        return results
 
-    # If not, return the empty result
-    return result
+# This serializes the result after the execution of the task
+def serialize_result(result):
+    """Function that returns the JSON text of a result"""
+    return json.dumps(result, sort_keys=True)
+
+# This keeps the JSON text of the result in the result store
+def post_result_json(job_id, text):
+    """Function that writes the JSON text of a result into the result store"""
+    RESULT_STORE.put_json(job_id, text)
+
+# This function returns None if the job is not done
+# Otherwise, it returns the JSON text of the result
+def get_result_json(job_id):
+    """Function that reads the JSON text of a result from the result store"""
+    return RESULT_STORE.get_json(job_id)
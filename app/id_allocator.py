@@ -0,0 +1,61 @@
+"""
+Id Allocator Module
+
+This module contains the allocators that create the ids of the jobs. Many
+request threads create ids at the same time, so an allocator never hands out
+the same id twice and doesn't take a lock for every id.
+
+'CounterAllocator' counts with 'itertools.count', whose next value is taken
+in a single step of the interpreter, so concurrent threads always get
+different numbers.
+
+'RangeAllocator' takes ranges of JOB_ID_BLOCK numbers from the shared job
+state, so each server process numbers its jobs from its own range and only
+writes to the database once per range. The ids of different processes
+interleave by range instead of by creation time.
+
+'create_id_allocator' returns the allocator for the job state of the server.
+"""
+import itertools
+import os
+from threading import Lock
+
+class CounterAllocator:
+    """Class that numbers the jobs of a single process"""
+    def __init__(self, start=1):
+        """Method that initiates the counter"""
+        self.counter = itertools.count(start)
+
+    def next_id(self):
+        """Method that returns a new job id"""
+        return "job_id_" + str(next(self.counter))
+
+class RangeAllocator:
+    """Class that numbers the jobs from ranges reserved in the shared state"""
+    def __init__(self, state, block=64):
+        """Method that initiates the allocator, the first range is taken with the first id"""
+        self.state = state
+        self.block = block
+        self.numbers = iter(())
+        self.lock = Lock()
+
+    # Taking the next number of a range iterator is a single step, so only
+    # the thread that finds the range exhausted takes the lock. Threads that
+    # find the same range exhausted reserve a single new range
+    def next_id(self):
+        """Method that returns a new job id"""
+        while True:
+            numbers = self.numbers
+            try:
+                return "job_id_" + str(next(numbers))
+            except StopIteration:
+                with self.lock:
+                    if self.numbers is numbers:
+                        start = self.state.reserve(self.block)
+                        self.numbers = iter(range(start, start + self.block))
+
+def create_id_allocator(state=None):
+    """Function that creates the id allocator of a job state"""
+    if state is None:
+        return CounterAllocator()
+    return RangeAllocator(state, int(os.getenv("JOB_ID_BLOCK", "64")))
@@ -0,0 +1,243 @@
+"""
+Job Registry Module
+
+This module contains the 'JobRegistry' class that keeps the status of the
+jobs. For each job it keeps a small 'JobRecord' (id, type, status and
+times), not the 'Job' itself, so the request data and the data ingestor of
+a job are released as soon as the job is done.
+
+Finished jobs are evicted oldest first, when there are more than
+JOBS_MAX_RETAINED jobs or when they finished more than JOBS_MAX_AGE
+seconds ago. Running jobs are never evicted. By default the limits are the
+ones of the memory result store (RESULT_STORE_MAX_ENTRIES results, each
+kept RESULT_STORE_TTL seconds), so a job is kept about as long as its result.
+
+Clients can wait for a job to finish: the registry creates a completion
+event for a job only when someone waits for it and sets it when the job is
+marked as done, which happens after its result is posted. A job that failed
+is marked with the "error" status, its result holds the reason.
+
+With a shared job state (JOB_STATE=sqlite), the registry also writes the
+jobs into the state and looks up there the jobs created by other processes.
+Those jobs are waited for by polling the state.
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from queue import SimpleQueue
+from threading import Lock, Event
+
+# Seconds between two checks of a job of another process
+POLL_INTERVAL = 0.05
+
+# Finished jobs are evicted from the shared state after
+# every EVICT_EVERY jobs marked as done
+EVICT_EVERY = 256
+
+class JobRecord:
+    """Class that holds the status of a job"""
+    __slots__ = ("job_id", "number", "type", "status", "created", "finished")
+
+    def __init__(self, job_id, job_type):
+        """Method that initiates the record of a running job"""
+        self.job_id = job_id
+        self.number = job_number(job_id)
+        self.type = job_type
+        self.status = "running"
+        self.created = time.monotonic()
+        self.finished = None
+
+# Get N from "job_id_N", so ids can be compared
+def job_number(job_id):
+    """Function that returns the number of a job id"""
+    try:
+        return int(str(job_id).rsplit("_", 1)[-1])
+    except ValueError:
+        return -1
+
+class JobRegistry:
+    """Class that keeps the records of the jobs"""
+    def __init__(self, max_jobs=None, max_age=None, state=None):
+        """Method that initiates the registry"""
+        if max_jobs is None:
+            max_jobs = int(os.getenv("JOBS_MAX_RETAINED")
+                           or os.getenv("RESULT_STORE_MAX_ENTRIES", "10000"))
+        if max_age is None:
+            max_age = os.getenv("JOBS_MAX_AGE") or os.getenv("RESULT_STORE_TTL")
+            max_age = float(max_age) if max_age else None
+
+        self.max_jobs = max_jobs
+        self.max_age = max_age
+        self.records = OrderedDict()
+        self.finished = deque()
+        self.events = {}
+        self.subscribers = set()
+        self.lock = Lock()
+        self.state = state
+        self.done_count = 0
+
+    def __contains__(self, job_id):
+        """Method that checks if a job is known"""
+        return self.get(job_id) is not None
+
+    def __len__(self):
+        """Method that returns the number of known jobs"""
+        if self.state is not None:
+            return self.state.count()
+        return len(self.records)
+
+    # A job of another process is read from the shared state
+    def get(self, job_id):
+        """Method that returns the record of a job, or None"""
+        record = self.records.get(job_id)
+
+        if record is None and self.state is not None:
+            row = self.state.get(job_id)
+            if row is not None:
+                record = JobRecord(job_id, row[0])
+                record.status = row[1]
+        return record
+
+    # Add a running job
+    def add(self, job):
+        """Method that adds the record of a job"""
+        with self.lock:
+            self.records[job.job_id] = JobRecord(job.job_id, job.type)
+            self._evict()
+
+        if self.state is not None:
+            self.state.add(job.job_id, job_number(job.job_id), job.type)
+
+    # Forget a job that was not accepted
+    def remove(self, job_id):
+        """Method that removes the record of a job"""
+        with self.lock:
+            self.records.pop(job_id, None)
+            event = self.events.pop(job_id, None)
+
+        if self.state is not None:
+            self.state.remove(job_id)
+
+        if event is not None:
+            event.set()
+
+    # Mark a job as done (or as failed, with the "error" status),
+    # it can be evicted from now on
+    def mark_done(self, job_id, status="done"):
+        """Method that marks a job as finished"""
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is None or record.status != "running":
+                return
+
+            record.status = status
+            record.finished = time.monotonic()
+            self.finished.append(record)
+            event = self.events.pop(job_id, None)
+            subscribers = list(self.subscribers)
+            self.done_count += 1
+            evict_state = self.done_count % EVICT_EVERY == 0
+            self._evict()
+
+        if self.state is not None:
+            self.state.mark_done(job_id, status)
+            if evict_state:
+                self.state.evict(self.max_jobs, self.max_age)
+
+        # Wake up the clients waiting for the job
+        if event is not None:
+            event.set()
+
+        for subscriber in subscribers:
+            subscriber.put(job_id)
+
+    # Returns a queue that receives the ids of the jobs that are done
+    def subscribe(self):
+        """Method that subscribes to the completions of the jobs"""
+        subscriber = SimpleQueue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Method that stops the completions sent to a subscriber"""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    # Block until the job is finished or until the timeout expires
+    # Returns True if the job is finished
+    def wait(self, job_id, timeout):
+        """Method that waits for a job to finish"""
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is not None:
+                if record.status != "running":
+                    return True
+                event = self.events.setdefault(job_id, Event())
+
+        if record is None:
+            return self._poll(job_id, timeout)
+        return event.wait(timeout)
+
+    # Wait for a job of another process, which is not in the
+    # records of this registry, by checking the shared state
+    def _poll(self, job_id, timeout):
+        """Method that waits for a job of the shared state to finish"""
+        if self.state is None:
+            return False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self.state.get(job_id)
+            if row is None:
+                return False
+            if row[1] != "running":
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    # Evict the oldest finished jobs while there are too many jobs
+    # or while the oldest finished job is too old
+    def _evict(self):
+        """Method that evicts finished jobs, called with the lock held"""
+        now = time.monotonic()
+
+        while self.finished:
+            record = self.finished[0]
+            too_many = len(self.records) > self.max_jobs
+            too_old = self.max_age is not None and now - record.finished > self.max_age
+            if not too_many and not too_old:
+                break
+
+            self.finished.popleft()
+            self.records.pop(record.job_id, None)
+
+    # Returns the jobs with the given status, whose number is greater
+    # than the number of since_id, at most limit of them, in the order
+    # of their numbers. The records are sorted, since a job can be added
+    # after a job that got a later number, which would otherwise be
+    # skipped by the next pages. The second value tells if there are more jobs
+    def list(self, status=None, since_id=None, limit=None):
+        """Method that returns a page of jobs and their status"""
+        since = job_number(since_id) if since_id is not None else None
+        jobs_list = []
+
+        if self.state is not None:
+            return self.state.list(status, since, limit)
+
+        with self.lock:
+            self._evict()
+
+            for record in sorted(self.records.values(), key=lambda record: record.number):
+                if since is not None and record.number <= since:
+                    continue
+                if status is not None and record.status != status:
+                    continue
+                if limit is not None and len(jobs_list) == limit:
+                    return jobs_list, True
+                jobs_list.append({record.job_id: record.status})
+
+        return jobs_list, False
@@ -0,0 +1,187 @@
+"""
+Job State Module
+
+This module contains the 'SqliteJobState' class, which keeps the ids, the
+status and the results of the jobs in a SQLite database, so that several
+server processes (the workers of a pre-fork server, or servers behind a
+load balancer) share them. A job can be polled on any process, whichever
+process created and computed it.
+
+The database is in WAL mode, so the readers don't block the writer, and
+every thread of every process opens its own connection. The job numbers
+come from a counter in the database, so two processes never create the
+same job id ('RangeAllocator' reserves them by ranges).
+
+'create_job_state' returns the state set by JOB_STATE: None for "local"
+(the default, where each process keeps its own jobs in its job registry
+and result store) or a 'SqliteJobState' for "sqlite", whose database is
+JOB_STATE_PATH.
+"""
+import os
+import sqlite3
+import time
+from threading import local
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, number INTEGER NOT NULL,
+                                 type TEXT, status TEXT NOT NULL,
+                                 created REAL NOT NULL, finished REAL);
+CREATE INDEX IF NOT EXISTS jobs_number ON jobs (number);
+CREATE TABLE IF NOT EXISTS results (job_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+INSERT OR IGNORE INTO counters VALUES ('job_id', 0);
+"""
+
+# Connections inherited from the parent process, kept open
+INHERITED = []
+
+class SqliteJobState:
+    """Class that keeps the jobs and their results in a SQLite database"""
+    def __init__(self, path="jobs.db", timeout=30.0):
+        """Method that initiates the state, creating the database if needed"""
+        self.path = path
+        self.timeout = timeout
+        self.local = local()
+
+        # The connection is closed right away, so a process forked
+        # later doesn't inherit it
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        """Method that opens a connection to the database"""
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # Each thread has its own connection. A connection opened before a
+    # fork belongs to the parent: it is neither used nor closed by the
+    # child, because closing it could checkpoint the database
+    def _connection(self):
+        """Method that returns the connection of the calling thread"""
+        if getattr(self.local, "pid", None) != os.getpid():
+            if getattr(self.local, "connection", None) is not None:
+                INHERITED.append(self.local.connection)
+            self.local.connection = self._connect()
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    # Increment the counter in a write transaction, so concurrent
+    # processes get different ranges. Returns the first number of
+    # the count numbers reserved
+    def reserve(self, count=1):
+        """Method that reserves the numbers of new jobs"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE counters SET value = value + ? WHERE name = 'job_id'",
+                               (count,))
+            number = connection.execute(
+                "SELECT value FROM counters WHERE name = 'job_id'").fetchone()[0]
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        return number - count + 1
+
+    def add(self, job_id, number, job_type):
+        """Method that adds a running job"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, 'running', ?, NULL)",
+            (job_id, number, job_type, time.time()))
+
+    def remove(self, job_id):
+        """Method that removes a job"""
+        self._connection().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    # The status of a finished job is "done", or "error" if it failed
+    def mark_done(self, job_id, status="done"):
+        """Method that marks a job as finished"""
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, finished = ? WHERE job_id = ?",
+            (status, time.time(), job_id))
+
+    # Returns (type, status) or None if the job is not known
+    def get(self, job_id):
+        """Method that returns the type and the status of a job"""
+        return self._connection().execute(
+            "SELECT type, status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def count(self):
+        """Method that returns the number of jobs"""
+        return self._connection().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    # Same page as 'JobRegistry.list', in the order the jobs were numbered
+    def list(self, status=None, since=None, limit=None):
+        """Method that returns a page of jobs and their status"""
+        query = "SELECT job_id, status FROM jobs WHERE number > ?"
+        params = [since if since is not None else -1]
+
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+
+        query += " ORDER BY number"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self._connection().execute(query, params).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        return [{job_id: status} for job_id, status in rows[:limit]], has_more
+
+    # Remove the oldest finished jobs (and their results) while there are
+    # more than max_jobs jobs, and the ones that finished more than max_age
+    # seconds ago
+    def evict(self, max_jobs, max_age=None):
+        """Method that evicts finished jobs"""
+        connection = self._connection()
+        excess = max(self.count() - max_jobs, 0)
+
+        victims = set(connection.execute(
+            "SELECT job_id FROM jobs WHERE status != 'running' ORDER BY number LIMIT ?",
+            (excess,)).fetchall())
+        if max_age is not None:
+            victims.update(connection.execute(
+                "SELECT job_id FROM jobs WHERE status != 'running' AND finished < ?",
+                (time.time() - max_age,)).fetchall())
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("DELETE FROM jobs WHERE job_id = ?", victims)
+            connection.executemany("DELETE FROM results WHERE job_id = ?", victims)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        return len(victims)
+
+    # The state is also the result store of the server
+    def put_json(self, job_id, text):
+        """Method that stores the JSON text of a result"""
+        self._connection().execute("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                                   (job_id, text))
+
+    # Returns None if there is no result for the job
+    def get_json(self, job_id):
+        """Method that returns the JSON text of a result"""
+        row = self._connection().execute(
+            "SELECT data FROM results WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+# JOB_STATE selects where the jobs are kept: "local" (the default)
+# or "sqlite", in the database at JOB_STATE_PATH
+def create_job_state():
+    """Function that creates the job state set in the environment"""
+    backend = os.getenv("JOB_STATE", "local")
+
+    if backend == "local":
+        return None
+    if backend == "sqlite":
+        return SqliteJobState(os.getenv("JOB_STATE_PATH", "jobs.db"))
+
+    raise ValueError(f"Unknown job state: {backend}")
@@ -0,0 +1,145 @@
+"""
+Metrics Module
+
+This module contains the 'Metrics' class that aggregates the timings of
+the jobs and renders them in the Prometheus text format for /api/metrics.
+
+Every job records the time spent in each stage of its life:
+
+    queue_wait  from its creation until a task runner takes it
+    index       getting the index of the question (filtering and grouping
+                the table, the first time the question is asked)
+    answer      building the answer from the index
+    serialize   converting the answer to JSON text
+    execute     the whole computation, in the thread or in a worker process
+    post        writing the result into the result store
+
+The stages are observed into histograms labelled by the type of the job,
+along with the duration of the whole job and a counter of the finished
+jobs by outcome (computed, cached, coalesced or failed). With worker
+processes, only the execute stage is timed for the computation.
+
+'METRICS' is the instance shared by the thread pool and the routes.
+"""
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Upper bounds of the buckets of the histograms, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Kind and description of each metric
+METRIC_HELP = {
+    "stats_job_stage_seconds": ("histogram", "Seconds spent by the jobs in each stage"),
+    "stats_job_duration_seconds": ("histogram", "Seconds from the creation of a job until "
+                                                "its result is posted"),
+    "stats_jobs_total": ("counter", "Finished jobs by outcome"),
+}
+
+class Histogram:
+    """Class that counts observations into buckets"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        """Method that initiates an empty histogram"""
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Method that adds an observation"""
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+# Format the labels of a sample, such as {type="best5",stage="index"}
+def format_labels(labels):
+    """Function that formats the labels of a sample"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Metrics:
+    """Class that aggregates the metrics of the server"""
+    def __init__(self):
+        """Method that initiates the metrics"""
+        self.histograms = {}
+        self.counters = {}
+        self.busy = 0
+        self.lock = Lock()
+
+    def observe(self, name, labels, value):
+        """Method that adds an observation to a histogram"""
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        """Method that increments a counter"""
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    # Count the task runners that are running a task
+    def running(self, delta):
+        """Method that changes the number of busy task runners"""
+        with self.lock:
+            self.busy += delta
+
+    # Called when a job is finished, with the timings it recorded
+    def observe_job(self, job, outcome):
+        """Method that records the timings and the outcome of a job"""
+        for stage, seconds in job.timings.items():
+            self.observe("stats_job_stage_seconds",
+                         (("type", job.type), ("stage", stage)), seconds)
+
+        self.observe("stats_job_duration_seconds", (("type", job.type),),
+                     time.perf_counter() - job.created)
+        self.increment("stats_jobs_total", (("type", job.type), ("outcome", outcome)))
+
+    # The gauges are (name, description, value) tuples given by the
+    # caller, a value can be a dict of samples keyed by their labels
+    def render(self, gauges=()):
+        """Method that returns the metrics in the Prometheus text format"""
+        with self.lock:
+            histograms = {key: (list(h.counts), h.sum, h.count)
+                          for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for name, (kind, description) in METRIC_HELP.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} "
+                                 f"{cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+        for name, description, value in gauges:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} gauge")
+            samples = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, sample in samples:
+                lines.append(f"{name}{format_labels(labels)} {sample}")
+
+        return "\n".join(lines) + "\n"
+
+# Metrics of the server
+METRICS = Metrics()
@@ -0,0 +1,142 @@
+"""
+Result Cache Module
+
+This module contains the 'ResultCache' class that memoizes the answers of
+the jobs. Two jobs with the same request type and the same request data
+(the question and, for the requests about a single state, the state, or for
+top_k the number and the order of the states) on the
+same version of the dataset have the same answer, so the answer is computed
+only once.
+
+While a job is computed, the identical jobs submitted in the meantime wait
+for its answer instead of being put in the task queue, so they don't
+occupy a task runner.
+"""
+import os
+from collections import OrderedDict
+from threading import Lock
+
+# Request types whose answer depends on the state from the request
+STATE_QUESTION_TYPES = ("state_mean", "state_diff_from_mean", "state_mean_by_category")
+
+# Fields of the request, besides the question, that change the answer
+ANSWER_FIELDS = {**dict.fromkeys(STATE_QUESTION_TYPES, ("state",)), "top_k": ("k", "order")}
+
+# Returned by lookup when the job waits for an identical job
+FOLLOWING = object()
+
+class ResultCache:
+    """Class that memoizes the answers of the jobs"""
+    def __init__(self, max_entries=None):
+        """Method that initiates the cache"""
+        if max_entries is None:
+            max_entries = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    # The key is made only from the parts of the request that change
+    # the answer and from the version of the dataset of the job.
+    # Requests that can't be used as a key are not cached
+    @staticmethod
+    def make_key(job):
+        """Method that creates the cache key of a job"""
+        if not isinstance(job.data, dict):
+            return None
+
+        question = job.data.get("question")
+        fields = tuple(job.data.get(field) for field in ANSWER_FIELDS.get(job.type, ()))
+
+        if not isinstance(question, str) or \
+                not all(isinstance(value, (str, int, type(None))) for value in fields):
+            return None
+        question_version = getattr(job.data_ingestor, "question_version", None)
+        version = question_version(question) if question_version is not None else None
+        return (version, job.type, question) + fields
+
+    # Returns the JSON text of the answer if it is known.
+    # Otherwise, if an identical job is being computed, the job waits
+    # for its answer and FOLLOWING is returned. If not, the job has
+    # to be computed and None is returned
+    def lookup(self, key, job):
+        """Method that looks up the answer of a job"""
+        if key is None or self.max_entries <= 0:
+            return None
+
+        with self.lock:
+            text = self.entries.get(key)
+            if text is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return text
+
+            if key in self.in_flight:
+                self.in_flight[key].append(job)
+                self.coalesced += 1
+                return FOLLOWING
+
+            self.in_flight[key] = []
+            self.misses += 1
+            return None
+
+    # Keep the answer of a computed job and return the
+    # jobs that were waiting for it
+    def complete(self, key, text):
+        """Method that stores the answer of a job"""
+        if key is None or self.max_entries <= 0:
+            return []
+
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            return self.in_flight.pop(key, [])
+
+    # Forget a job that won't be computed, unless other jobs
+    # are already waiting for its answer
+    # Returns True if the job was forgotten
+    def release(self, key):
+        """Method that forgets a job that no other job waits for"""
+        with self.lock:
+            if self.in_flight.get(key):
+                return False
+            self.in_flight.pop(key, None)
+            return True
+
+    # The job failed, so return the jobs that were waiting for it
+    def abandon(self, key):
+        """Method that forgets a job that couldn't be computed"""
+        if key is None:
+            return []
+
+        with self.lock:
+            return self.in_flight.pop(key, [])
+
+    def clear(self):
+        """Method that removes all answers from the cache"""
+        with self.lock:
+            self.entries.clear()
+
+    # Remove the answers of the given questions, their keys are not
+    # used anymore after the questions got a new version
+    def invalidate(self, questions):
+        """Method that removes the answers of some questions from the cache"""
+        questions = set(questions)
+        with self.lock:
+            for key in [key for key in self.entries if key[2] in questions]:
+                del self.entries[key]
+
+    def stats(self):
+        """Method that returns the counters of the cache"""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "coalesced": self.coalesced, "size": len(self.entries),
+                    "max_entries": self.max_entries}
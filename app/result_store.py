@@ -0,0 +1,136 @@
+"""
+Result Store Module
+
+This module contains the stores that keep the results of the finished jobs.
+Results are kept as the JSON text created when the job finished, so a poll
+for a finished job doesn't parse anything again.
+
+'MemoryResultStore' keeps the results in a dictionary bounded by a maximum
+number of entries (least recently used results are evicted first) and by an
+optional time to live. Evicted results can be spilled into another store.
+
+'DiskResultStore' keeps each result in its own file in the results folder,
+the way the results were kept before.
+
+With JOB_STATE=sqlite the results are kept in the database of the shared
+job state ('SqliteJobState'), so any server process can return them.
+
+'create_result_store' builds the store configured by the environment.
+"""
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from app.job_state import SqliteJobState
+
+FOLDER_PATH = "results"
+
+class MemoryResultStore:
+    """Class that keeps the results in memory"""
+    def __init__(self, max_entries=10000, ttl=None, spill=None):
+        """Method that initiates the store"""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.spill = spill
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    # Add the result of a job, evicting the least recently
+    # used results if the store is full
+    def put_json(self, job_id, text):
+        """Method that stores the JSON text of a result"""
+        evicted = []
+        with self.lock:
+            self.entries[job_id] = (text, time.monotonic())
+            self.entries.move_to_end(job_id)
+
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False))
+
+        # Write the evicted results outside the lock
+        if self.spill is not None:
+            for evicted_id, (evicted_text, _) in evicted:
+                self.spill.put_json(evicted_id, evicted_text)
+
+    # Returns None if there is no result for the job
+    def get_json(self, job_id):
+        """Method that returns the JSON text of a result"""
+        with self.lock:
+            entry = self.entries.get(job_id)
+
+            if entry is not None:
+                text, created = entry
+
+                # Drop the result if it expired
+                if self.ttl is not None and time.monotonic() - created > self.ttl:
+                    del self.entries[job_id]
+                    return None
+
+                self.entries.move_to_end(job_id)
+                return text
+
+        if self.spill is not None:
+            return self.spill.get_json(job_id)
+        return None
+
+    def __len__(self):
+        """Method that returns the number of results kept in memory"""
+        return len(self.entries)
+
+class DiskResultStore:
+    """Class that keeps each result in a file"""
+    def __init__(self, folder=FOLDER_PATH):
+        """Method that initiates the store"""
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+
+    # Create the file path for getting and posting
+    # the result in the results folder
+    def create_path(self, job_id):
+        """Method that creates the path of the file of a job"""
+        return os.path.join(self.folder, job_id + ".json")
+
+    # Write into a temporary file and rename it, so a reader
+    # never sees a file that is only partially written
+    def put_json(self, job_id, text):
+        """Method that writes the JSON text of a result into its file"""
+        file_path = self.create_path(job_id)
+        temp_path = file_path + ".tmp"
+
+        with open(temp_path, "w", encoding='utf-8') as file:
+            file.write(text)
+        os.replace(temp_path, file_path)
+
+    # Returns None if the file doesn't exist
+    def get_json(self, job_id):
+        """Method that reads the JSON text of a result from its file"""
+        try:
+            with open(self.create_path(job_id), "r", encoding='utf-8') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+# The store is chosen with RESULT_STORE ("memory", "disk" or "sqlite",
+# the default with a shared job state).
+# The memory store keeps at most RESULT_STORE_MAX_ENTRIES results,
+# each for RESULT_STORE_TTL seconds, and writes the evicted ones in
+# the results folder if RESULT_STORE_SPILL is set
+def create_result_store():
+    """Function that creates the result store set in the environment"""
+    shared = os.getenv("JOB_STATE") == "sqlite"
+    backend = os.getenv("RESULT_STORE", "sqlite" if shared else "memory")
+
+    if backend == "disk":
+        return DiskResultStore()
+
+    if backend == "sqlite":
+        return SqliteJobState(os.getenv("JOB_STATE_PATH", "jobs.db"))
+
+    if backend != "memory":
+        raise ValueError(f"Unknown result store: {backend}")
+
+    max_entries = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "10000"))
+    ttl = os.getenv("RESULT_STORE_TTL")
+    spill = DiskResultStore() if os.getenv("RESULT_STORE_SPILL") else None
+
+    return MemoryResultStore(max_entries, float(ttl) if ttl else None, spill)
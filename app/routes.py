@@ -8,11 +8,183 @@ If we have a POST request, we can get a question, create a job and return
 the data for it.
 """
 
+import json
+from queue import Full, Empty
 from flask import request, jsonify
 from app import webserver
-from app.extra import Job, get_result
+from app.extra import Job, get_result_json
+from app.data_ingestor import QUESTION_TYPES, RANKING_ORDERS
+from app.result_cache import STATE_QUESTION_TYPES
+from app.task_queue import PRIORITY_CLASSES
+from app.metrics import METRICS
 from app.webserver_logger import logger, error_logger
 
+# Create a job of the given type from the request data, submit it
+# into the thread pool and return the response with its job_id
+# With the fast path enabled, known answers are computed right away
+# and, if the request has "?inline=1", returned with the response
+def schedule_job(job_type, data=None):
+    """Function that creates a job for the request and submits it"""
+    # Assuming the request contains JSON data
+    if data is None:
+        data = request.json
+    logger.info("Got request %s", data)
+
+    # Check if server is shut down
+    if webserver.tasks_runner.shutdown_event.is_set():
+        # Return error because the server is not active
+        # because it was shut down
+        response = {"status": "error", "reason": "Server not active"}
+        error_logger.error(response)
+        return jsonify(response)
+
+    # The client can change the priority class of the job
+    priority = request.args.get("priority")
+    if priority is not None and priority not in PRIORITY_CLASSES:
+        response = {"status": "error", "reason": "Invalid priority"}
+        error_logger.error(response)
+        return jsonify(response)
+
+    # Create job_id for the job. The allocator is safe to call from
+    # many request threads and, with a shared job state, from many
+    # server processes. A rejected job doesn't give its id back
+    job_id = webserver.tasks_runner.job_ids.next_id()
+
+    # Create job with the request type, job_id, data from the json file
+    # and the data ingestor in order to process data
+    job = Job(job_type, job_id, data, webserver.data_ingestor)
+    job.priority = priority
+
+    # The answer is computed in this thread only if it is cheap,
+    # meaning the question was already indexed
+    fast_path = webserver.fast_path and isinstance(data, dict) \
+        and webserver.data_ingestor.is_indexed(data.get("question"))
+
+    # Add the job into the job registry where I hold all jobs created
+    # and submit job into thread pool
+    webserver.tasks_runner.jobs.add(job)
+    try:
+        done = webserver.tasks_runner.submit(job, fast_path=fast_path)
+    except Full:
+        # The queue is full, the client has to try again later
+        webserver.tasks_runner.jobs.remove(job_id)
+        retry_after = webserver.tasks_runner.retry_after
+        response = {"status": "error", "reason": "Too many jobs", "retry_after": retry_after}
+        error_logger.error(response)
+        return jsonify(response), 429, {"Retry-After": str(retry_after)}
+
+    # Return response with job_id
+    response = {"status": "done", "job_id": job_id}
+    logger.info(response)
+
+    # Put the JSON text of the answer into the response
+    if done and webserver.fast_path and request.args.get("inline") in ("1", "true"):
+        result = get_result_json(job_id)
+        return webserver.response_class(
+            f'{{"data": {result}, "job_id": "{job_id}", "status": "done"}}\n',
+            mimetype="application/json")
+
+    return jsonify(response)
+
+# Check the number of states and the order of a top_k request,
+# 5 and "best" when they are missing
+def valid_ranking(data):
+    """Function that checks the parameters of a top_k request"""
+    k = data.get("k", 5)
+    return isinstance(k, int) and not isinstance(k, bool) and k > 0 \
+        and data.get("order", "best") in RANKING_ORDERS
+
+# The admin routes change the dataset of the server, so they are
+# only served when ADMIN_ROUTES is set. Returns None if they are
+def admin_disabled():
+    """Function that returns the response of a disabled admin route"""
+    if webserver.admin_routes:
+        return None
+
+    response = {"status": "error", "reason": "Admin routes disabled"}
+    error_logger.error(response)
+    return jsonify(response), 403
+
+# Check that an item of a batch has the fields its type needs: a question,
+# a state for the requests about a single state and a valid k and order
+# for top_k, so the answer of every item can be computed
+def valid_item(item):
+    """Function that checks an item of a batch"""
+    if not isinstance(item, dict) or item.get("type") not in QUESTION_TYPES \
+            or not isinstance(item.get("question"), str):
+        return False
+    if item["type"] in STATE_QUESTION_TYPES and not isinstance(item.get("state"), str):
+        return False
+    return item["type"] != "top_k" or valid_ranking(item)
+
+# Format the completion of a job as an event of the stream, with the
+# JSON text of its result put into the event as it is. The status is
+# the one of the finished job, or None if the job is not known
+def format_event(job_id, event_format, status="done"):
+    """Function that creates the event of a finished job"""
+    result = get_result_json(job_id) if status is not None else None
+
+    if status is None:
+        event = json.dumps({"job_id": job_id, "reason": "Invalid job_id", "status": "error"})
+    elif result is None:
+        event = f'{{"job_id": "{job_id}", "reason": "Result not found", "status": "error"}}'
+    elif status == "error":
+        event = json.dumps({"job_id": job_id, "reason": json.loads(result)["reason"],
+                            "status": "error"})
+    else:
+        event = f'{{"data": {result}, "job_id": "{job_id}", "status": "done"}}'
+
+    if event_format == "ndjson":
+        return event + "\n"
+    return f"data: {event}\n\n"
+
+# Generate the events of the finished jobs. With job_ids, only those jobs
+# are sent (the ones already finished first) and the stream ends when all
+# of them were sent. Without job_ids, every job is sent until the client
+# leaves. Failed jobs are sent as error events
+def stream_events(job_ids, event_format):
+    """Function that generates the events of the finished jobs"""
+    registry = webserver.tasks_runner.jobs
+
+    # Subscribe before looking at the jobs, so no completion is missed
+    subscriber = registry.subscribe()
+    try:
+        pending = None
+        if job_ids:
+            pending = set(job_ids)
+            for job_id in job_ids:
+                record = registry.get(job_id)
+                if record is None or record.status != "running":
+                    pending.discard(job_id)
+                    yield format_event(job_id, event_format, record and record.status)
+
+        while pending is None or pending:
+            try:
+                job_id = subscriber.get(timeout=webserver.stream_keep_alive)
+            except Empty:
+                # Keep the connection open
+                yield ": keep-alive\n\n" if event_format == "sse" else "\n"
+
+                # Jobs of other processes are not announced to the
+                # subscriber, they are found done in the shared state
+                for job_id in list(pending or ()):
+                    record = registry.get(job_id)
+                    if record is None or record.status != "running":
+                        pending.discard(job_id)
+                        yield format_event(job_id, event_format, record and record.status)
+                continue
+
+            if pending is not None:
+                if job_id not in pending:
+                    continue
+                pending.discard(job_id)
+
+            # The job was marked as finished before it was announced
+            record = registry.get(job_id)
+            yield format_event(job_id, event_format, record.status if record else "done")
+    finally:
+        registry.unsubscribe(subscriber)
+
 # Example endpoint definition
 @webserver.route('/api/post_endpoint', methods=['POST'])
 def post_endpoint():
@@ -41,17 +213,30 @@ def get_jobs():
     if request.method == 'GET':
         logger.info("Print all jobs")
 
+        # The jobs can be filtered by status, by the last job id seen
+        # by the client (since_id) and by the number of jobs (limit)
+        status = request.args.get("status")
+        since_id = request.args.get("since_id")
+        limit = request.args.get("limit", type=int)
+
+        # A page has at least one job
+        if limit is not None and limit < 1:
+            response = {"status": "error", "reason": "Invalid limit"}
+            error_logger.error(response)
+            return jsonify(response)
+
         # Check if dict is not empty
         if webserver.tasks_runner.jobs:
             # Format data according to the example provided
-            jobs_list = []
-
-            for job_id, job in webserver.tasks_runner.jobs.items():
-                jobs_list.append({job_id: job.status})
+            jobs_list, has_more = webserver.tasks_runner.jobs.list(status, since_id, limit)
 
             # Return all jobs
             response = {"status": "done", "data": jobs_list}
-            logger.info(response)
+
+            # Tell the client where the next page starts
+            if has_more and jobs_list:
+                response["next_since_id"] = list(jobs_list[-1])[0]
+            logger.info("Returned %d jobs", len(jobs_list))
 
         # Sent json with error
         else:
@@ -73,8 +258,29 @@ def get_running_jobs():
         # Get size of task queue from thread pool
         running_jobs = webserver.tasks_runner.task_queue.qsize()
 
-        # Return running jobs
-        response = {"status": "done", "num_jobs": str(running_jobs)}
+        # Return running jobs, along with the capacity of the queue
+        # (null if the queue is not bounded) and the depth and wait
+        # times of each priority class
+        response = {"status": "done", "num_jobs": str(running_jobs),
+                    "queue_depth": running_jobs,
+                    "queue_capacity": webserver.tasks_runner.queue_capacity or None,
+                    "classes": webserver.tasks_runner.task_queue.class_stats()}
+
+        logger.info(response)
+        return jsonify(response)
+
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
+
+@webserver.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Method that returns the counters of the result cache"""
+    if request.method == 'GET':
+        logger.info("Print cache stats")
+
+        # Get the hits, misses and size of the result cache
+        response = {"status": "done", "data": webserver.tasks_runner.result_cache.stats()}
 
         logger.info(response)
         return jsonify(response)
@@ -83,6 +289,35 @@ def get_running_jobs():
     error_logger.error({"error": "Method not allowed"})
     return jsonify({"error": "Method not allowed"}), 405
 
+@webserver.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Method that returns the metrics in the Prometheus text format"""
+    if request.method == 'GET':
+        tasks_runner = webserver.tasks_runner
+        classes = tasks_runner.task_queue.class_stats()
+
+        # The gauges are read when the metrics are scraped
+        gauges = [
+            ("stats_pool_threads", "Task runners of the thread pool", tasks_runner.num_threads),
+            ("stats_pool_busy_threads", "Task runners running a task", METRICS.busy),
+            ("stats_pool_utilization", "Fraction of the task runners running a task",
+             METRICS.busy / tasks_runner.num_threads),
+            ("stats_queue_depth", "Tasks waiting in the queue by priority class",
+             {(("class", name),): stats["depth"] for name, stats in classes.items()}),
+            ("stats_queue_oldest_wait_seconds", "Wait of the oldest queued task by class",
+             {(("class", name),): stats["oldest_wait"] for name, stats in classes.items()}),
+            ("stats_queue_capacity", "Capacity of the queue, 0 if it is not bounded",
+             tasks_runner.queue_capacity),
+            ("stats_jobs_known", "Jobs kept by the job registry", len(tasks_runner.jobs)),
+        ]
+
+        return webserver.response_class(METRICS.render(gauges),
+                                        mimetype="text/plain; version=0.0.4")
+
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
+
 @webserver.route('/api/get_results/<job_id>', methods=['GET'])
 def get_response(job_id):
     """Method that returns the data with a certain job id"""
@@ -92,26 +327,56 @@ def get_response(job_id):
         logger.info("JobID is %s", job_id)
 
         # Check if job_id is valid
-        if job_id not in webserver.tasks_runner.jobs:
+        record = webserver.tasks_runner.jobs.get(job_id)
+        if record is None:
             response = {"status": "error", "reason": "Invalid job_id"}
             error_logger.error(response)
+            return jsonify(response)
+
+        # Get the JSON text of the result with the given job_id
+        # from the result store
+        result = get_result_json(job_id)
+
+        # With "?wait=<seconds>" the request waits until the job is done,
+        # at most the given number of seconds, instead of returning
+        # "running" right away
+        wait = request.args.get("wait", type=float)
+        if result is None and wait:
+            wait = min(wait, webserver.results_max_wait)
+            if webserver.tasks_runner.jobs.wait(job_id, wait):
+                record = webserver.tasks_runner.jobs.get(job_id) or record
+                result = get_result_json(job_id)
+
+        # A result is posted right before its job is marked as done
+        # (or as failed), so a job found running is about to be marked
+        if result is not None and record.status == "running":
+            webserver.tasks_runner.jobs.wait(job_id, webserver.results_max_wait)
+            record = webserver.tasks_runner.jobs.get(job_id) or record
+
+        # The result of a failed job holds the reason
+        if record.status == "error" and result is not None:
+            response = {"status": "error", "reason": json.loads(result)["reason"]}
+            error_logger.error(response)
+            return jsonify(response)
 
-        # Get result from file with the given job_id
-        # from results
-        result = get_result(job_id)
+        # The job is finished, but its result was evicted from the store
+        if result is None and record.status != "running":
+            response = {"status": "error", "reason": "Result expired"}
+            error_logger.error(response)
+            return jsonify(response)
 
-        # If I didn't create a result file, but the job id
+        # If there is no result, but the job id
         # exists, it means that the task is still running
-        if not result:
+        if result is None:
             response = {"status": "running"}
             logger.info(response)
+            return jsonify(response)
 
-        # Return result
-        else:
-            response = {"status": "done", "data": result}
-            logger.info(response)
-
-        return jsonify(response)
+        # Return result, the JSON text is put into the response
+        # as it is, without decoding and encoding it again
+        logger.info("Job %s is done", job_id)
+        return webserver.response_class(f'{{"data": {result}, "status": "done"}}\n',
+                                        mimetype="application/json")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -141,37 +406,7 @@ def states_mean_request():
     """Method that calculates the states mean"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("states_mean", job_id, data, webserver.data_ingestor)
-
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
-
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
-
-        return jsonify(response)
+        return schedule_job("states_mean")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -182,37 +417,7 @@ def state_mean_request():
     """Method that calculates a given state's mean"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("state_mean", job_id, data, webserver.data_ingestor)
-
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
-
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
-
-        return jsonify(response)
+        return schedule_job("state_mean")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -223,37 +428,7 @@ def best5_request():
     """Method that calculates the best 5 states"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("best5", job_id, data, webserver.data_ingestor)
-
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
-
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
-
-        return jsonify(response)
+        return schedule_job("best5")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -264,37 +439,26 @@ def worst5_request():
     """Method that calculates the worst 5 states"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("worst5", job_id, data, webserver.data_ingestor)
+        return schedule_job("worst5")
 
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
 
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
+@webserver.route('/api/top_k', methods=['POST'])
+def top_k_request():
+    """Method that calculates the k best or worst states"""
+    # Check if I sent a POST request
+    if request.method == 'POST':
+        # The body has the question, the number of states "k" and
+        # the "order" of the states, "best" or "worst"
+        data = request.json
+        if not isinstance(data, dict) or not valid_ranking(data):
+            response = {"status": "error", "reason": "Invalid k or order"}
             error_logger.error(response)
+            return jsonify(response)
 
-        return jsonify(response)
+        return schedule_job("top_k", data)
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -305,37 +469,7 @@ def global_mean_request():
     """Method that calculates the global mean"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("global_mean", job_id, data, webserver.data_ingestor)
-
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
-
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
-
-        return jsonify(response)
+        return schedule_job("global_mean")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -346,37 +480,7 @@ def diff_from_mean_request():
     """Method that calculates the diff between the global mean and the states mean"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
-
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("diff_from_mean", job_id, data, webserver.data_ingestor)
-
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
-
-            # Increment the job_counter
-            webserver.job_counter += 1
-
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
-
-        return jsonify(response)
+        return schedule_job("diff_from_mean")
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
@@ -387,75 +491,111 @@ def state_diff_from_mean_request():
     """Method that calculates the diff between the global mean and a given state's mean"""
     # Check if I sent a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
+        return schedule_job("state_diff_from_mean")
 
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
 
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("state_diff_from_mean", job_id, data, webserver.data_ingestor)
+@webserver.route('/api/mean_by_category', methods=['POST'])
+def mean_by_category_request():
+    """Method that calculates the mean by category"""
+    # Check if I sent a POST request
+    if request.method == 'POST':
+        return schedule_job("mean_by_category")
+
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
+
+@webserver.route('/api/state_mean_by_category', methods=['POST'])
+def state_mean_by_category_request():
+    """Method that calculates a given state's mean by category"""
+    # Check if I sent a POST request
+    if request.method == 'POST':
+        return schedule_job("state_mean_by_category")
 
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
 
-            # Increment the job_counter
-            webserver.job_counter += 1
+@webserver.route('/api/batch', methods=['POST'])
+def batch_request():
+    """Method that answers a list of questions in a single job"""
+    # Check if I sent a POST request
+    if request.method == 'POST':
+        # The request contains a list of {"type", "question", "state"}
+        # items, either as the whole body or as its "items" field
+        data = request.json
+        items = data.get("items") if isinstance(data, dict) else data
 
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
+        # Check that every item can be answered
+        if not isinstance(items, list) or not items \
+                or len(items) > webserver.batch_max_items \
+                or not all(valid_item(item) for item in items):
+            response = {"status": "error", "reason": "Invalid batch"}
             error_logger.error(response)
+            return jsonify(response)
 
-        return jsonify(response)
+        # The answers of all items are retrieved
+        # with /api/get_results/<job_id>
+        return schedule_job("batch", {"items": items})
 
     # Method Not Allowed
     error_logger.error({"error": "Method not allowed"})
     return jsonify({"error": "Method not allowed"}), 405
 
-@webserver.route('/api/mean_by_category', methods=['POST'])
-def mean_by_category_request():
-    """Method that calculates the mean by category"""
-    # Check if I sent a POST request
+@webserver.route('/api/stream', methods=['GET', 'POST'])
+def stream_request():
+    """Method that streams the results of the jobs as they finish"""
+    # The job ids are given as "?job_ids=job_id_1,job_id_2" or
+    # in the "job_ids" list of the JSON body of a POST request
     if request.method == 'POST':
-        # Assuming the request contains JSON data
         data = request.json
-        logger.info("Got request %s", data)
-
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
+        job_ids = data.get("job_ids") if isinstance(data, dict) else data
+    else:
+        job_ids = [job_id for job_id in request.args.get("job_ids", "").split(",") if job_id]
+
+    if job_ids is not None and (not isinstance(job_ids, list)
+                                or not all(isinstance(job_id, str) for job_id in job_ids)):
+        response = {"status": "error", "reason": "Invalid job_ids"}
+        error_logger.error(response)
+        return jsonify(response)
 
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("mean_by_category", job_id, data, webserver.data_ingestor)
+    # Server-Sent Events by default, one JSON object per line with "?format=ndjson"
+    event_format = "ndjson" if request.args.get("format") == "ndjson" else "sse"
+    mimetype = "application/x-ndjson" if event_format == "ndjson" else "text/event-stream"
+    logger.info("Stream %s jobs", len(job_ids) if job_ids else "all")
 
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
+    return webserver.response_class(stream_events(job_ids, event_format), mimetype=mimetype)
 
-            # Increment the job_counter
-            webserver.job_counter += 1
+@webserver.route('/api/admin/reload', methods=['POST'])
+def reload_request():
+    """Method that reloads the dataset in the background"""
+    disabled = admin_disabled()
+    if disabled:
+        return disabled
 
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
+    if request.method == 'POST':
+        # The body can contain the "path" of a new CSV file in the
+        # data folder, otherwise the current file is loaded again
+        data = request.get_json(silent=True) or {}
+        path = data.get("path") if isinstance(data, dict) else None
+        logger.info("Reload dataset %s", path)
+
+        if path is not None:
+            try:
+                path = webserver.dataset_reloader.resolve_path(str(path))
+            except ValueError:
+                response = {"status": "error", "reason": "Invalid path"}
+                error_logger.error(response)
+                return jsonify(response)
+
+        if webserver.dataset_reloader.reload(path):
+            response = {"status": "done", "data": webserver.dataset_reloader.status()}
             logger.info(response)
         else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
+            response = {"status": "error", "reason": "Reload in progress"}
             error_logger.error(response)
 
         return jsonify(response)
@@ -464,41 +604,63 @@ def mean_by_category_request():
     error_logger.error({"error": "Method not allowed"})
     return jsonify({"error": "Method not allowed"}), 405
 
-@webserver.route('/api/state_mean_by_category', methods=['POST'])
-def state_mean_by_category_request():
-    """Method that calculates a given state's mean by category"""
-    # Check if I sent a POST request
-    if request.method == 'POST':
-        # Assuming the request contains JSON data
-        data = request.json
-        logger.info("Got request %s", data)
+@webserver.route('/api/admin/append', methods=['POST'])
+def append_request():
+    """Method that appends rows to the dataset"""
+    disabled = admin_disabled()
+    if disabled:
+        return disabled
 
-        # Check if server is not shut down
-        if not webserver.tasks_runner.shutdown_event.is_set():
-            # Create job_id for the job
-            job_id = "job_id_" + str(webserver.job_counter)
+    if request.method == 'POST':
+        # The body contains the "rows" to append, each with the columns
+        # used by the questions, or the "path" of a CSV file of new rows
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("rows"), list) \
+                and not isinstance(data.get("path"), str):
+            response = {"status": "error", "reason": "Invalid rows"}
+            error_logger.error(response)
+            return jsonify(response)
+        logger.info("Append to dataset %s", data)
+
+        path = data.get("path")
+        if path is not None:
+            try:
+                path = webserver.dataset_reloader.resolve_path(path)
+            except ValueError:
+                response = {"status": "error", "reason": "Invalid path"}
+                error_logger.error(response)
+                return jsonify(response)
+
+        try:
+            result = webserver.dataset_reloader.append(data.get("rows"), path)
+        except (ValueError, TypeError, OSError) as e:
+            response = {"status": "error", "reason": f"Invalid rows: {e}"}
+            error_logger.error(response)
+            return jsonify(response)
 
-            # Create job with the request type, job_id, data from the json file
-            # and the data ingestor in order to process data
-            job = Job("state_mean_by_category", job_id, data, webserver.data_ingestor)
+        if result is None:
+            response = {"status": "error", "reason": "Reload in progress"}
+            error_logger.error(response)
+        else:
+            response = {"status": "done", "data": result}
+            logger.info(response)
 
-            # Add the job into the jobs dict where I hold all jobs created
-            # and submit job into thread pool
-            webserver.tasks_runner.jobs[job_id] = job
-            webserver.tasks_runner.submit(job)
+        return jsonify(response)
 
-            # Increment the job_counter
-            webserver.job_counter += 1
+    # Method Not Allowed
+    error_logger.error({"error": "Method not allowed"})
+    return jsonify({"error": "Method not allowed"}), 405
 
-            # Return response with job_id
-            response = {"status": "done", "job_id": job_id}
-            logger.info(response)
-        else:
-            # Return error because the server is not active
-            # because it was shut down
-            response = {"status": "error", "reason": "Server not active"}
-            error_logger.error(response)
+@webserver.route('/api/admin/dataset', methods=['GET'])
+def dataset_request():
+    """Method that returns the path, version and state of the dataset"""
+    disabled = admin_disabled()
+    if disabled:
+        return disabled
 
+    if request.method == 'GET':
+        response = {"status": "done", "data": webserver.dataset_reloader.status()}
+        logger.info(response)
         return jsonify(response)
 
     # Method Not Allowed
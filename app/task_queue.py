@@ -0,0 +1,123 @@
+"""
+Task Queue Module
+
+This module contains the 'PriorityTaskQueue' class, the queue of the thread
+pool. It keeps one FIFO lane for each priority class, so cheap lookups of
+interactive clients don't wait behind a flood of heavy jobs:
+
+    high    global_mean, state_mean, state_diff_from_mean, state_mean_by_category
+    normal  states_mean, best5, worst5, top_k, diff_from_mean
+    low     mean_by_category, batch
+
+A job gets the class of its type, unless the client asks for another one
+with "?priority=high|normal|low".
+
+The runners take the head of the lane with the best score, which is the
+rank of the class (0 for high) minus the seconds the head waited divided by
+TP_PRIORITY_AGING. A task that waited TP_PRIORITY_AGING seconds is served
+like a task of the class above it, so low priority tasks are never starved
+(TP_PRIORITY_AGING=0 turns aging off).
+
+The queue is a 'queue.Queue', so its capacity, 'put_nowait' raising
+'queue.Full' and the blocking calls work as before. The None sentinels of
+the shutdown have their own lane, which is served only when the other ones
+are empty, so the runners finish the queued tasks before they stop.
+"""
+import os
+import time
+from collections import deque
+from queue import Queue
+
+PRIORITY_CLASSES = ("high", "normal", "low")
+
+# Default class of each job type
+JOB_CLASSES = {
+    "global_mean": "high",
+    "state_mean": "high",
+    "state_diff_from_mean": "high",
+    "state_mean_by_category": "high",
+    "states_mean": "normal",
+    "best5": "normal",
+    "worst5": "normal",
+    "top_k": "normal",
+    "diff_from_mean": "normal",
+    "mean_by_category": "low",
+    "batch": "low",
+}
+
+def task_class(task):
+    """Function that returns the priority class of a task"""
+    if task.priority in PRIORITY_CLASSES:
+        return task.priority
+    return JOB_CLASSES.get(task.type, "normal")
+
+class PriorityTaskQueue(Queue):
+    """Class that queues the tasks by priority class, with aging"""
+    def __init__(self, maxsize=0, aging=None):
+        """Method that initiates the queue"""
+        if aging is None:
+            aging = float(os.getenv("TP_PRIORITY_AGING", "1"))
+        self.aging = aging
+        super().__init__(maxsize)
+
+    # The methods below are called by 'queue.Queue'
+    # with the mutex of the queue held
+    def _init(self, maxsize):
+        """Method that creates the lanes of the classes"""
+        self.lanes = {name: deque() for name in PRIORITY_CLASSES}
+        self.sentinels = deque()
+        self.stats = {name: {"dequeued": 0, "total_wait": 0.0, "max_wait": 0.0}
+                      for name in PRIORITY_CLASSES}
+
+    def _qsize(self):
+        """Method that returns the number of queued items"""
+        return sum(len(lane) for lane in self.lanes.values()) + len(self.sentinels)
+
+    def _put(self, item):
+        """Method that appends an item to its lane"""
+        if item is None:
+            self.sentinels.append(item)
+        else:
+            self.lanes[task_class(item)].append((time.monotonic(), item))
+
+    def _get(self):
+        """Method that removes the head of the lane with the best score"""
+        now = time.monotonic()
+        best, best_score = None, None
+
+        for rank, name in enumerate(PRIORITY_CLASSES):
+            lane = self.lanes[name]
+            if lane:
+                score = rank - (now - lane[0][0]) / self.aging if self.aging > 0 else rank
+                if best_score is None or score < best_score:
+                    best, best_score = name, score
+
+        if best is None:
+            return self.sentinels.popleft()
+
+        enqueued, task = self.lanes[best].popleft()
+        stats = self.stats[best]
+        stats["dequeued"] += 1
+        stats["total_wait"] += now - enqueued
+        stats["max_wait"] = max(stats["max_wait"], now - enqueued)
+        return task
+
+    # For each class: the queued tasks, how long the oldest one has
+    # waited and the mean and maximum wait of the dequeued ones
+    def class_stats(self):
+        """Method that returns the depth and the wait times of each class"""
+        now = time.monotonic()
+        with self.mutex:
+            result = {}
+            for name in PRIORITY_CLASSES:
+                lane = self.lanes[name]
+                stats = self.stats[name]
+                result[name] = {
+                    "depth": len(lane),
+                    "oldest_wait": now - lane[0][0] if lane else 0.0,
+                    "dequeued": stats["dequeued"],
+                    "mean_wait": stats["total_wait"] / stats["dequeued"]
+                        if stats["dequeued"] else 0.0,
+                    "max_wait": stats["max_wait"],
+                }
+            return result
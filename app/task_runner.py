@@ -6,14 +6,34 @@ This module contains two classes.
 its functionalties. It is responsible with the flow of the tasks.
 
 'TaskRunner' class is the one that runs the tasks at hand. It processes
-the task from the task queue and then puts the result into a file.
+the task from the task queue with the executor of the pool (in the thread
+or in a worker process) and then puts the result into the result store.
+
+The queue serves the tasks by priority class ('PriorityTaskQueue').
+
+Before a task is put into the queue, its answer is looked up in the result
+cache. Known answers are posted right away and tasks identical to a task
+that is being computed wait for its answer instead of being queued.
+
+A task that fails is finished with the "error" status and a result with
+the reason, and so are the identical tasks that waited for it.
 """
 
-from queue import Queue
+from queue import Full
+import json
 import os
+import time
 import multiprocessing
 from threading import Thread, Event
-from app.extra import post_result
+from app.extra import post_result_json
+from app.executors import LocalExecutor, create_executor
+from app.result_cache import ResultCache, FOLLOWING
+from app.job_registry import JobRegistry
+from app.job_state import create_job_state
+from app.id_allocator import create_id_allocator
+from app.task_queue import PriorityTaskQueue
+from app.metrics import METRICS
+from app.webserver_logger import error_logger
 
 class ThreadPool:
     """Class that creates the thread pool used for the application"""
@@ -21,10 +41,15 @@ class ThreadPool:
         """Method that initiates the variables, as well as creates the list
         of task runners"""
         self.num_threads = self._get_num_threads()
-        self.task_queue = Queue()
+        self.queue_capacity = int(os.getenv("TP_QUEUE_CAPACITY", "0"))
+        self.retry_after = int(os.getenv("TP_RETRY_AFTER", "1"))
+        self.task_queue = PriorityTaskQueue(maxsize=self.queue_capacity)
         self.shutdown_event = Event()
         self.task_runners = []
-        self.jobs = {}
+        self.jobs = JobRegistry(state=create_job_state())
+        self.job_ids = create_id_allocator(self.jobs.state)
+        self.result_cache = ResultCache()
+        self.executor = create_executor(self.num_threads)
         self._create_task_runners()
 
     # Check if the environment variable TP_NUM_OF_THREADS is defined
@@ -39,11 +64,12 @@ class ThreadPool:
         return multiprocessing.cpu_count()
 
     # Creates list of task_runners which share the same
-    # queue, jobs dictionary and shutdown event
+    # queue, job registry and shutdown event
     def _create_task_runners(self):
         """Method that creates the task runners list"""
         for _ in range(self.num_threads):
-            task_runner = TaskRunner(self.task_queue, self.shutdown_event, self.jobs)
+            task_runner = TaskRunner(self.task_queue, self.shutdown_event, self.jobs,
+                                     self.result_cache, self.executor)
             self.task_runners.append(task_runner)
 
     # Start all threads simultaniously
@@ -54,9 +80,36 @@ class ThreadPool:
 
     # Add job into the queue
     # If the shutdown event is not set, we can add a task
-    def submit(self, task):
+    # If the answer is already known, the task is done without being
+    # queued and if an identical task is computed, the task waits for it
+    # With fast_path the task is executed in the calling thread
+    # If the queue is full, the task is rejected with queue.Full
+    # Returns True if the task is already done
+    def submit(self, task, fast_path=False):
         """Method that submits the task into the thread pool"""
-        self.task_queue.put(task)
+        task.cache_key = self.result_cache.make_key(task)
+        cached = self.result_cache.lookup(task.cache_key, task)
+
+        if cached is FOLLOWING:
+            return False
+
+        if cached is not None:
+            finish_task(task, cached, self.jobs, "cached")
+            return True
+
+        # The fast path only answers from the index, so it doesn't need a worker
+        if fast_path:
+            return run_task(task, self.jobs, self.result_cache, LocalExecutor())
+
+        try:
+            self.task_queue.put_nowait(task)
+        except Full:
+            # Tasks that started waiting for this one were already
+            # accepted, so the task is queued anyway
+            if self.result_cache.release(task.cache_key):
+                raise
+            self.task_queue.put(task)
+        return False
 
     # Shutdown the whole application
     def shutdown(self):
@@ -65,6 +118,8 @@ class ThreadPool:
 
         # Change all instances of task_runner from the
         # list of task runners into None
+        # The task runners finish the tasks that are already in the
+        # queue before they get None, so this waits for a free slot
         for _ in range(self.num_threads):
             self.task_queue.put(None)
 
@@ -72,37 +127,88 @@ class ThreadPool:
         for task_runner in self.task_runners:
             task_runner.join()
 
+        # Stop the worker processes, if there are any
+        self.executor.shutdown()
+
+# Mark job as done and post its result
+# The outcome tells how its answer was found, for the metrics
+def finish_task(task, text, jobs, outcome):
+    """Function that posts the result of a task and marks it as done"""
+    # Post the result into the result store
+    start = time.perf_counter()
+    post_result_json(task.job_id, text)
+    task.timings["post"] = time.perf_counter() - start
+
+    # Mark job as done in the job and in the registry
+    task.status = "done"
+    jobs.mark_done(task.job_id)
+    METRICS.observe_job(task, outcome)
+
+# Mark job as failed and post the reason as its result
+def fail_task(task, reason, jobs):
+    """Function that posts the reason of a failed task and marks it as failed"""
+    post_result_json(task.job_id, json.dumps({"reason": reason}))
+    task.status = "error"
+    jobs.mark_done(task.job_id, "error")
+    METRICS.increment("stats_jobs_total", (("type", task.type), ("outcome", "failed")))
+
+# Execute a task with the executor, keep its answer in the cache
+# and post it for the task and for the tasks that waited for it
+# Returns True if the task was executed successfully
+def run_task(task, jobs, result_cache, executor):
+    """Function that executes a task and posts its result"""
+    start = time.perf_counter()
+    task.timings["queue_wait"] = start - task.created
+
+    try:
+        # Get the JSON text of the result of the task
+        text = executor.run(task)
+        task.timings["execute"] = time.perf_counter() - start
+
+        # Keep the answer in the cache and get the
+        # tasks that waited for it
+        waiting = result_cache.complete(task.cache_key, text)
+
+        finish_task(task, text, jobs, "computed")
+        for done_task in waiting:
+            finish_task(done_task, text, jobs, "coalesced")
+        return True
+    except Exception as e:
+        reason = f"Job failed: {e}"
+        error_logger.error({"job_id": task.job_id, "status": "error", "reason": reason})
+
+        # The tasks that waited for it would fail the same way
+        fail_task(task, reason, jobs)
+        for failed_task in result_cache.abandon(task.cache_key):
+            fail_task(failed_task, reason, jobs)
+        return False
+
 class TaskRunner(Thread):
     """Class that creates the task runner that handles the execution of tasks"""
-    def __init__(self, task_queue, shutdown_event, jobs):
+    def __init__(self, task_queue, shutdown_event, jobs, result_cache, executor):
         """Method that initiates the task runner"""
         super().__init__()
         self.task_queue = task_queue
         self.shutdown_event = shutdown_event
         self.jobs = jobs
+        self.result_cache = result_cache
+        self.executor = executor
 
+    # Tasks are not submitted after the shutdown event is set, so
+    # the runner stops after the tasks that were already queued
     def run(self):
         """Method that runs the tasks from the queue"""
-        while not self.shutdown_event.is_set():
+        while True:
             # Wait for notification or until task queue is not empty
             task = self.task_queue.get()
 
             # Check if it's time to exit
             if task is None:
                 break
-            try:
-                # Get the result from the execute function of
-                # the task from the queue
-                results = task.execute()
-
-                # Mark job as done
-                task.status = "done"
 
-                # Put the job with the updated information into
-                # the jobs dictionary
-                self.jobs[task.job_id] = task
-
-                # Post the result into its respective file
-                post_result(task.job_id, results)
-            except Exception as e:
-                print(f"Error executing task: {e}")
+            # Execute the task and post its result
+            METRICS.running(1)
+            try:
+                run_task(task, self.jobs, self.result_cache, self.executor)
+            finally:
+                METRICS.running(-1)
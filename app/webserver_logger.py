@@ -1,5 +1,126 @@
+"""
+Webserver Logger Module
+
+The request threads don't write the log records themselves: the records are
+put into a queue by a 'QueueHandler' and a 'QueueListener' thread formats
+them and writes them to the console and to the rotating 'file.log'. The
+listener starts with the first record of the process (so importing the app
+doesn't start it, and a forked worker starts its own) and the records left
+in the queue are written when the process exits.
+
+Before a record is queued, large arguments (such as the data of a request)
+are shortened with 'reprlib' and the message is cut at LOG_MAX_LENGTH
+characters, so the request thread never formats a large payload. With
+LOG_SAMPLE_RATE below 1, only that fraction of the info records is kept,
+warnings and errors are always kept. LOG_ASYNC=0 writes the records in the
+request thread instead, as before.
+"""
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import random
+import reprlib
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+
+# Limits of the representation of the arguments of a record
+SHORT_REPR = reprlib.Repr()
+SHORT_REPR.maxlevel = 3
+SHORT_REPR.maxdict = 8
+SHORT_REPR.maxlist = 8
+SHORT_REPR.maxstring = 80
+SHORT_REPR.maxother = 80
+
+def shorten(value):
+    """Function that returns a value with a bounded representation"""
+    if isinstance(value, (str, int, float)):
+        return value
+    return SHORT_REPR.repr(value)
+
+class SamplingFilter(logging.Filter):
+    """Class that keeps a fraction of the records below warning"""
+    def __init__(self, rate):
+        """Method that initiates the filter with the fraction of records kept"""
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        """Method that decides if a record is kept"""
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class AsyncHandler(QueueHandler):
+    """Class that hands the records to a listener thread"""
+    def __init__(self, handlers, max_length):
+        """Method that initiates the handler, the listener starts with the first record"""
+        super().__init__(SimpleQueue())
+        self.handlers = handlers
+        self.max_length = max_length
+        self.listener = None
+        self.listener_pid = None
+        self.start_lock = Lock()
+
+    # The listener thread doesn't survive a fork, so a
+    # forked process starts its own, with its own queue
+    def emit(self, record):
+        """Method that queues a record"""
+        if self.listener_pid != os.getpid():
+            self._start_listener()
+        super().emit(record)
+
+    def _start_listener(self):
+        """Method that starts the listener thread of this process"""
+        with self.start_lock:
+            if self.listener_pid == os.getpid():
+                return
+            self.queue = SimpleQueue()
+            self.listener = QueueListener(self.queue, *self.handlers,
+                                          respect_handler_level=True)
+            self.listener.start()
+            self.listener_pid = os.getpid()
+
+    # Build the message with shortened arguments and cut it,
+    # the listener only adds the time and the level
+    def prepare(self, record):
+        """Method that prepares a record to be queued"""
+        msg = shorten(record.msg) if not isinstance(record.msg, str) else record.msg
+        if record.args:
+            # A single dict argument is the mapping of "%(name)s" fields,
+            # or the value of a "%s" field
+            args = record.args
+            if isinstance(args, tuple):
+                args = tuple(shorten(arg) for arg in args)
+            elif "%(" in msg:
+                args = {key: shorten(value) for key, value in args.items()}
+            else:
+                args = shorten(args)
+            message = msg % args
+        else:
+            message = str(msg)
+
+        if record.exc_info:
+            message += "\n" + logging.Formatter().formatException(record.exc_info)
+
+        if len(message) > self.max_length:
+            message = f"{message[:self.max_length]}... ({len(message)} characters)"
+
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    # Called when the process exits, the listener
+    # writes the records that are still queued
+    def close(self):
+        """Method that stops the listener"""
+        with self.start_lock:
+            if self.listener is not None and self.listener_pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self.listener_pid = None
+        super().close()
 
 # Set up message formatter
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -7,17 +128,26 @@ format_handler = logging.StreamHandler()
 format_handler.setFormatter(formatter)
 
 # Set up info handler which is a rotating file handler
-info_handler = RotatingFileHandler('file.log', maxBytes=1024, backupCount=3)
+info_handler = RotatingFileHandler('file.log',
+                                   maxBytes=int(os.getenv("LOG_MAX_BYTES", str(1024 * 1024))),
+                                   backupCount=3, delay=True)
 info_handler.setLevel(logging.INFO)
 info_handler.setFormatter(formatter)
 
 # Get logger for the rotating file handlers
 logger = logging.getLogger()
 logger.setLevel(logging.INFO) # set level as INFO
-logger.addHandler(format_handler) # add formatter
-logger.addHandler(info_handler) # add file handler
 
-# Get logger for errors
+if os.getenv("LOG_ASYNC", "1") == "1":
+    # The handlers are run by the listener thread
+    async_handler = AsyncHandler([format_handler, info_handler],
+                                 int(os.getenv("LOG_MAX_LENGTH", "1000")))
+    async_handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1"))))
+    logger.addHandler(async_handler)
+else:
+    logger.addHandler(format_handler) # add formatter
+    logger.addHandler(info_handler) # add file handler
+
+# Get logger for errors, its records go through the handlers of the root logger
 error_logger = logging.getLogger("webserver.log")
 error_logger.setLevel(logging.ERROR) # set level as ERROR
-error_logger.addHandler(format_handler) # add formatter
\ No newline at end of file
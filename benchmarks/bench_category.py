@@ -0,0 +1,88 @@
+"""
+Category Benchmark
+
+Compares the old `iterrows` implementation of `mean_by_category` and
+`state_mean_by_category` with the vectorized one used by `QuestionIndex`.
+The old implementation groups the rows of the question and builds one key
+per row in Python; `state_mean_by_category` even groups every state and
+drops the rows of the other states. The new implementation builds all keys
+at once and splits the means by state, so a request is a dict lookup.
+The "cold" column is the time of building the whole `QuestionIndex` of the
+question and the "warm" column is the time of answering from it.
+
+Both implementations must give the same answers, the benchmark checks it
+(through JSON, since a category without values has a NaN mean).
+
+Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_category --repeat 5
+"""
+import argparse
+import json
+import time
+
+from app import webserver
+from app.data_ingestor import DataIngestor, QuestionIndex
+
+GROUP_COLUMNS = ['LocationDesc', 'Stratification1', 'StratificationCategory1']
+
+def old_mean_by_category(table):
+    """Function that answers mean_by_category going through the rows"""
+    results = {}
+    mean = table.groupby(GROUP_COLUMNS, observed=True)['Data_Value'].mean().reset_index()
+    for _, row in mean.iterrows():
+        key = f"('{row['LocationDesc']}', '{row['StratificationCategory1']}', " \
+              f"'{row['Stratification1']}')"
+        results[key] = row['Data_Value']
+    return results
+
+def old_state_mean_by_category(table, state):
+    """Function that answers state_mean_by_category going through the rows"""
+    temp_dict = {}
+    mean = table.groupby(GROUP_COLUMNS, observed=True)['Data_Value'].mean().reset_index()
+    for _, row in mean.iterrows():
+        if row['LocationDesc'] == state:
+            key = f"('{row['StratificationCategory1']}', '{row['Stratification1']}')"
+            temp_dict[key] = row['Data_Value']
+    return {state: temp_dict}
+
+def timed(function, repeat):
+    """Function that returns the mean duration of a call in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5, help="calls of each implementation")
+    args = parser.parse_args()
+
+    # Both implementations group the rows, so they are
+    # loaded even if DATASET_CHUNK_ROWS is set
+    ingestor = DataIngestor(webserver.csv_path, chunk_rows=0)
+    data = ingestor.csv_data
+
+    print(f"{'question':40} {'type':24} {'old (ms)':>10} {'cold (ms)':>10} "
+          f"{'warm (ms)':>10}")
+    for question in sorted(ingestor.questions):
+        table = data[data['Question'] == question]
+        state = table['LocationDesc'].iloc[0]
+
+        old, old_time = timed(lambda: old_mean_by_category(table), args.repeat)
+        index, cold_time = timed(lambda: QuestionIndex(table), args.repeat)
+        new, warm_time = timed(lambda: dict(index.category_means), args.repeat)
+        assert json.dumps(old) == json.dumps(new), question
+        print(f"{question[:40]:40} {'mean_by_category':24} {old_time:10.2f} "
+              f"{cold_time:10.2f} {warm_time:10.4f}")
+
+        old, old_time = timed(lambda: old_state_mean_by_category(table, state), args.repeat)
+        new, warm_time = timed(lambda: {state: dict(index.state_category_means[state])},
+                               args.repeat)
+        assert json.dumps(old) == json.dumps(new), question
+        print(f"{'':40} {'state_mean_by_category':24} {old_time:10.2f} "
+              f"{cold_time:10.2f} {warm_time:10.4f}")
+
+if __name__ == "__main__":
+    main()
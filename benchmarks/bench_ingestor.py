@@ -0,0 +1,108 @@
+"""
+Ingestor Benchmark
+
+Measures how many jobs per second `DataIngestor.answer_question` can answer
+on the full dataset. The "before" numbers come from `scan_answer`, which is
+the old implementation that filters the whole table and regroups it for every
+job. The "after" numbers use the per-question index, first with an empty index
+(cold, every question is built once) and then with the index already built.
+With DATASET_CHUNK_ROWS there are no rows to scan, so only the "after"
+numbers are printed.
+
+Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_ingestor --jobs 2000
+"""
+import argparse
+import itertools
+import time
+
+from app import webserver
+from app.data_ingestor import QUESTION_TYPES
+
+# Old implementation of answer_question, kept here as the baseline
+def scan_answer(ingestor, data, question_type):
+    """Function that answers a question by scanning the whole table"""
+    question = data['question']
+    table = ingestor.csv_data[ingestor.csv_data['Question'] == question]
+    results = {}
+
+    if question_type in ("states_mean", "state_mean", "diff_from_mean",
+                         "state_diff_from_mean"):
+        mean = table.groupby("LocationDesc", observed=True)["Data_Value"].mean()
+        global_mean = table["Data_Value"].mean()
+        for k, v in sorted(mean.items(), key=lambda item: item[1]):
+            if question_type.startswith("state_") and k != data['state']:
+                continue
+            results[k] = global_mean - v if "diff" in question_type else v
+
+    elif question_type in ("best5", "worst5", "top_k"):
+        mean = table.groupby("LocationDesc", observed=True)["Data_Value"].mean()
+        ascending = question in ingestor.questions_best_is_min
+        if question_type == "worst5" or data.get("order") == "worst":
+            ascending = not ascending
+        results = dict(mean.sort_values(ascending=ascending).head(data.get("k", 5)))
+
+    elif question_type == "global_mean":
+        results = {'global_mean': table["Data_Value"].mean()}
+
+    else:
+        mean = table.groupby(['LocationDesc', 'Stratification1', 'StratificationCategory1'],
+                             observed=True)['Data_Value'].mean().reset_index()
+        for _, row in mean.iterrows():
+            if question_type == "mean_by_category":
+                key = f"('{row['LocationDesc']}', '{row['StratificationCategory1']}', " \
+                      f"'{row['Stratification1']}')"
+                results[key] = row['Data_Value']
+            elif row['LocationDesc'] == data['state']:
+                key = f"('{row['StratificationCategory1']}', '{row['Stratification1']}')"
+                results.setdefault(data['state'], {})[key] = row['Data_Value']
+
+    return results
+
+def make_jobs(ingestor, num_jobs):
+    """Function that creates a mix of jobs over all questions and states"""
+    questions = sorted(ingestor.questions)
+    states = sorted({state for question in questions
+                     for state in ingestor.get_index(question).state_means})
+    combinations = itertools.cycle(itertools.product(QUESTION_TYPES, questions))
+    jobs = []
+    for i in range(num_jobs):
+        question_type, question = next(combinations)
+        jobs.append((question_type, {"question": question, "state": states[i % len(states)]}))
+    return jobs
+
+def run(answer, jobs):
+    """Function that runs all jobs and returns the number of jobs per second"""
+    start = time.perf_counter()
+    for question_type, data in jobs:
+        answer(data, question_type)
+    return len(jobs) / (time.perf_counter() - start)
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--jobs", type=int, default=2000, help="number of jobs to answer")
+    args = parser.parse_args()
+
+    ingestor = webserver.data_ingestor
+    jobs = make_jobs(ingestor, args.jobs)
+
+    # With DATASET_CHUNK_ROWS there is no table to scan
+    before = None
+    if ingestor.csv_data is not None:
+        before = run(lambda data, question_type: scan_answer(ingestor, data, question_type),
+                     jobs)
+    ingestor.question_index.clear()
+    cold = run(ingestor.answer_question, jobs)
+    warm = run(ingestor.answer_question, jobs)
+
+    print(f"jobs:                {len(jobs)}")
+    if before is not None:
+        print(f"before (scan):       {before:10.1f} jobs/sec")
+    print(f"after (cold index):  {cold:10.1f} jobs/sec")
+    print(f"after (warm index):  {warm:10.1f} jobs/sec" +
+          (f"  ({warm / before:.1f}x)" if before is not None else ""))
+
+if __name__ == "__main__":
+    main()
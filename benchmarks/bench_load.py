@@ -0,0 +1,279 @@
+"""
+Load Benchmark
+
+Drives the REST API with concurrent clients: each client posts a question
+chosen from a weighted mix of the nine statistics endpoints and polls
+/api/get_results/<job_id> until the job is done. For each endpoint it
+reports the p50, p95 and p99 latency from the POST to the result and the
+jobs per second, once for each TP_NUM_OF_THREADS setting (TP_NUM_OF_THREADS
+is capped at the number of CPUs by the server).
+
+The requests go through the Flask test client or, with --transport http,
+through a real HTTP server started on a free local port (the clients use a
+new connection for each request). With --url the requests are sent to a
+server that is already running and --threads doesn't apply.
+
+Each setting runs in its own process. The results are written as JSON in
+benchmarks/results/ and --compare prints the change from an earlier run:
+
+    python -m benchmarks.bench_load --threads 1,2,4 --jobs 2000
+    python -m benchmarks.bench_load --transport http --compare benchmarks/results/<file>.json
+
+Run it from the project root, next to the CSV file.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+ENDPOINTS = ("states_mean", "state_mean", "best5", "worst5", "global_mean",
+             "diff_from_mean", "state_diff_from_mean", "mean_by_category",
+             "state_mean_by_category")
+
+def parse_mix(text):
+    """Function that parses a mix such as "global_mean=3,best5=1" into weights"""
+    if not text:
+        return {endpoint: 1.0 for endpoint in ENDPOINTS}
+
+    mix = {}
+    for item in text.split(","):
+        endpoint, _, weight = item.partition("=")
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+        mix[endpoint] = float(weight or 1)
+    return mix
+
+def percentile(values, fraction):
+    """Function that returns a percentile of sorted values"""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+class ClientTransport:
+    """Class that sends the requests through the Flask test client"""
+    def __init__(self, app):
+        """Method that initiates the transport, each thread gets its own client"""
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None):
+        """Method that sends a request and returns its status and JSON body"""
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.get_json()
+
+class HttpTransport:
+    """Class that sends the requests to an HTTP server"""
+    def __init__(self, url):
+        """Method that initiates the transport with the URL of the server"""
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, body=None):
+        """Method that sends a request and returns its status and JSON body"""
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+# Post a job and poll its result, returns the seconds from the
+# POST to the result, or None if the job was not accepted
+def run_job(transport, endpoint, body, poll_interval):
+    """Function that runs a job through the API"""
+    start = time.perf_counter()
+    status, response = transport.request("POST", "/api/" + endpoint, body)
+    if status != 200 or response.get("status") != "done":
+        return None
+
+    path = "/api/get_results/" + response["job_id"]
+    while True:
+        status, response = transport.request("GET", path)
+        if status != 200 or response.get("status") == "error":
+            return None
+        if response.get("status") == "done":
+            return time.perf_counter() - start
+        time.sleep(poll_interval)
+
+# Run the jobs with concurrent clients, returns the latencies of
+# each endpoint, the failed jobs of each endpoint and the seconds
+def run_load(transport, questions, states, args):
+    """Function that runs the load and returns its measurements"""
+    mix = parse_mix(args.mix)
+    endpoints, weights = list(mix), list(mix.values())
+    numbers = itertools.count()
+    latencies = {endpoint: [] for endpoint in endpoints}
+    failures = {endpoint: 0 for endpoint in endpoints}
+
+    def client(seed):
+        rng = random.Random(seed)
+        while next(numbers) < args.jobs:
+            endpoint = rng.choices(endpoints, weights)[0]
+            body = {"question": rng.choice(questions), "state": rng.choice(states)}
+            latency = run_job(transport, endpoint, body, args.poll_interval)
+            if latency is None:
+                failures[endpoint] += 1
+            else:
+                latencies[endpoint].append(latency)
+
+    threads = [threading.Thread(target=client, args=(args.seed + i,))
+               for i in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.perf_counter() - start
+
+def summarize(latencies, failures, seconds):
+    """Function that computes the statistics of each endpoint and of all jobs"""
+    def stats(values, failed):
+        values = sorted(values)
+        if not values:
+            return {"jobs": 0, "failed": failed, "jobs_per_sec": 0.0}
+        return {"jobs": len(values), "failed": failed,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "jobs_per_sec": len(values) / seconds}
+
+    summary = {endpoint: stats(values, failures[endpoint])
+               for endpoint, values in latencies.items()}
+    summary["all"] = stats(list(itertools.chain(*latencies.values())),
+                           sum(failures.values()))
+    return summary
+
+# Runs in the process of a setting: starts the server if needed,
+# runs the load and prints the summary as JSON
+def measure(args):
+    """Function that measures one setting"""
+    # pylint: disable=import-outside-toplevel
+    from app.data_ingestor import DataIngestor
+
+    server = None
+    if args.url:
+        ingestor = DataIngestor(args.csv)
+        transport = HttpTransport(args.url)
+    else:
+        from app import webserver
+        webserver.start()
+        ingestor = webserver.data_ingestor
+        if args.transport == "http":
+            from werkzeug.serving import make_server
+            server = make_server("127.0.0.1", 0, webserver, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            transport = HttpTransport(f"http://127.0.0.1:{server.server_port}")
+        else:
+            transport = ClientTransport(webserver)
+
+    # The states come from the indexes, since there are no rows with
+    # DATASET_CHUNK_ROWS. The indexes are built before the load, as the
+    # preload of a pre-fork server does
+    questions = sorted(ingestor.questions)
+    states = sorted({state for question in questions
+                     for state in ingestor.get_index(question).state_means})
+
+    latencies, failures, seconds = run_load(transport, questions, states, args)
+    print(json.dumps(summarize(latencies, failures, seconds)))
+
+    if server is not None:
+        server.shutdown()
+    if not args.url:
+        webserver.tasks_runner.shutdown()
+
+def run_setting(num_threads, argv):
+    """Function that measures a setting in a new process"""
+    env = dict(os.environ)
+    if num_threads is not None:
+        env["TP_NUM_OF_THREADS"] = str(num_threads)
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_load", "--measure"] + argv,
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+def print_run(name, summary, previous=None):
+    """Function that prints the statistics of a setting"""
+    print(f"\nTP_NUM_OF_THREADS={name}")
+    print(f"{'endpoint':24} {'jobs':>6} {'failed':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} "
+          f"{'p99 (ms)':>10} {'jobs/sec':>10}")
+    for endpoint, stats in summary.items():
+        line = (f"{endpoint:24} {stats['jobs']:6} {stats['failed']:6} "
+                f"{stats.get('p50_ms', 0):10.2f} {stats.get('p95_ms', 0):10.2f} "
+                f"{stats.get('p99_ms', 0):10.2f} {stats['jobs_per_sec']:10.1f}")
+
+        # Change of the p99 latency and of the throughput from the earlier run
+        old = (previous or {}).get(endpoint)
+        if old and old.get("p99_ms") and old["jobs_per_sec"]:
+            line += (f"  p99 {(stats.get('p99_ms', 0) / old['p99_ms'] - 1) * 100:+.0f}%"
+                     f"  jobs/sec {(stats['jobs_per_sec'] / old['jobs_per_sec'] - 1) * 100:+.0f}%")
+        print(line)
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--transport", choices=["client", "http"], default="client",
+                        help="Flask test client or local HTTP server")
+    parser.add_argument("--url", help="URL of a running server to send the requests to")
+    parser.add_argument("--threads", default="", help="TP_NUM_OF_THREADS settings, like 1,2,4")
+    parser.add_argument("--mix", default="", help="weights of the endpoints, like "
+                                                  "global_mean=3,mean_by_category=1")
+    parser.add_argument("--jobs", type=int, default=1000, help="jobs of each setting")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--poll-interval", type=float, default=0.002,
+                        help="seconds between two polls of a result")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the choices of the clients")
+    parser.add_argument("--output", help="file of the results, by default in benchmarks/results/")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+        return
+
+    argv = ["--csv", args.csv, "--transport", args.transport, "--mix", args.mix,
+            "--jobs", str(args.jobs), "--clients", str(args.clients),
+            "--poll-interval", str(args.poll_interval), "--seed", str(args.seed)]
+    if args.url:
+        argv += ["--url", args.url]
+
+    settings = [int(value) for value in args.threads.split(",") if value] or [None]
+    if args.url:
+        settings = [None]
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            previous = json.load(file)["runs"]
+
+    runs = {}
+    for num_threads in settings:
+        name = str(num_threads) if num_threads is not None else "default"
+        runs[name] = run_setting(num_threads, argv)
+        print_run(name, runs[name], previous.get(name))
+
+    # Keep the results, so later runs can be compared with them
+    output = args.output or os.path.join(
+        RESULTS_DIR, time.strftime("load-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({"time": time.time(), "transport": "url" if args.url else args.transport,
+                   "mix": parse_mix(args.mix), "jobs": args.jobs, "clients": args.clients,
+                   "runs": runs}, file, indent=2)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    main()
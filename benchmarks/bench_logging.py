@@ -0,0 +1,95 @@
+"""
+Logging Benchmark
+
+Measures the latency of the requests of the server with logging turned off,
+with the records written by the request threads (LOG_ASYNC=0) and with the
+records handed to the listener thread of the logging pipeline (the default).
+Half of the requests are batches, whose data is a large log argument.
+
+Each mode runs in its own process, in a temporary folder which receives its
+'file.log'. Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_logging --requests 2000
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+MODES = {
+    "off": {"LOG_ASYNC": "1"},
+    "sync": {"LOG_ASYNC": "0"},
+    "async": {"LOG_ASYNC": "1"},
+}
+
+def percentile(values, fraction):
+    """Function that returns a percentile of sorted values"""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+# Post the requests in this process and print the
+# latencies in milliseconds as a JSON list
+def measure(mode, requests):
+    """Function that measures the latency of the requests"""
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+
+    client = webserver.test_client()
+    ingestor = webserver.data_ingestor
+    questions = sorted(ingestor.questions)
+    batch = [{"type": "states_mean", "question": question} for question in questions] * 20
+
+    # Build the indexes, so only the requests are measured
+    ingestor.build_index()
+
+    latencies = []
+    for i in range(requests):
+        start = time.perf_counter()
+        if i % 2:
+            client.post("/api/batch", json=batch)
+        else:
+            client.post("/api/global_mean", json={"question": questions[i % len(questions)]})
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    webserver.tasks_runner.shutdown()
+    print(json.dumps(latencies))
+
+def run(mode, requests, csv_path):
+    """Function that runs a mode in a new process and returns its latencies"""
+    with tempfile.TemporaryDirectory() as folder:
+        env = {**os.environ, **MODES[mode], "DATASET_PATH": os.path.abspath(csv_path),
+               "PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_logging",
+                                 "--measure", mode, "--requests", str(requests)],
+                                cwd=folder, env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, check=True).stdout
+    return sorted(json.loads(output.splitlines()[-1]))
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--requests", type=int, default=2000, help="requests of each mode")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.requests)
+        return
+
+    print(f"{'mode':8} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'req/sec':>10}")
+    for mode in MODES:
+        latencies = run(mode, args.requests, args.csv)
+        print(f"{mode:8} {percentile(latencies, 0.50):10.3f} {percentile(latencies, 0.95):10.3f} "
+              f"{percentile(latencies, 0.99):10.3f} {len(latencies) / sum(latencies) * 1000:10.1f}")
+
+if __name__ == "__main__":
+    main()
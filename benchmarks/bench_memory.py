@@ -0,0 +1,72 @@
+"""
+Memory Benchmark
+
+Compares the memory used by the dataset when it is loaded as the raw
+`pd.read_csv` frame (all columns, text as Python objects) and when it is
+loaded by `DataIngestor` (only the used columns, categorical text columns
+and float64 values). Each load runs in its own process, so the resident
+memory of one load doesn't hide the other. The snapshot of the dataset
+is disabled, since a memory mapped snapshot would hide the memory of the
+parsed frame.
+
+Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_memory
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+def resident_memory():
+    """Function that returns the resident memory of the process in MB"""
+    with open("/proc/self/status", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+# Load the dataset in this process and print the memory used by the frame
+# and the growth of the resident memory, separated by a space
+def measure(mode, csv_path):
+    """Function that loads the dataset and prints the memory it uses"""
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+
+    if mode == "raw":
+        before = resident_memory()
+        frame = pd.read_csv(csv_path)
+    else:
+        from app.data_ingestor import DataIngestor
+
+        before = resident_memory()
+        frame = DataIngestor(csv_path, chunk_rows=0).csv_data
+
+    after = resident_memory()
+    frame_size = frame.memory_usage(deep=True).sum() / 2 ** 20
+    print(f"{frame_size} {after - before}")
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--mode", choices=["raw", "ingestor"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.csv)
+        return
+
+    env = {**os.environ, "DATASET_CACHE": "0"}
+    print(f"{'load':10} {'frame (MB)':>12} {'RSS growth (MB)':>16}")
+    for mode in ("raw", "ingestor"):
+        output = subprocess.run([sys.executable, "-m", "benchmarks.bench_memory",
+                                 "--csv", args.csv, "--mode", mode],
+                                capture_output=True, text=True, check=True, env=env).stdout
+        frame_size, rss = map(float, output.split()[-2:])
+        print(f"{mode:10} {frame_size:12.1f} {rss:16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Scaling Benchmark
+
+Measures how the data ingestor behaves as the dataset grows: for each scale
+a larger CSV file is written by 'benchmarks.scale_dataset', then, in a new
+process, the benchmark measures the time to load it (parsing the CSV, the
+binary snapshot is disabled), the growth of the resident memory, and the
+latency of each question type. The cold latency includes building the
+index of the question, the warm latency uses the index.
+
+With --chunk-rows the file is read in chunks of that many rows, keeping only
+the sums of the groups (DATASET_CHUNK_ROWS), so the memory of both modes can
+be compared. Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_scaling --scales 1,10,100
+    python -m benchmarks.bench_scaling --scales 1,10,100 --chunk-rows 100000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.data_ingestor import QUESTION_TYPES
+from benchmarks.bench_memory import resident_memory
+from benchmarks.scale_dataset import SPREADS, scale_dataset
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+# Load the file in this process and print the measurements as JSON
+def measure(csv_path, repeat):
+    """Function that measures the data ingestor on a file"""
+    # pylint: disable=import-outside-toplevel
+    from app.data_ingestor import DataIngestor
+
+    before = resident_memory()
+    start = time.perf_counter()
+    ingestor = DataIngestor(csv_path)
+    load_time = time.perf_counter() - start
+    memory = resident_memory() - before
+
+    # A state of each question, the indexes are built again below
+    states = {question: next(iter(ingestor.get_index(question).state_means), None)
+              for question in ingestor.questions}
+
+    latencies = {}
+    for question_type in QUESTION_TYPES:
+        cold, warm = 0.0, 0.0
+        for question in sorted(ingestor.questions):
+            request = {"question": question, "state": states[question]}
+
+            # The first call builds the index of the question
+            ingestor.question_index.clear()
+            start = time.perf_counter()
+            ingestor.answer_question(request, question_type)
+            cold += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                ingestor.answer_question(request, question_type)
+            warm += (time.perf_counter() - start) / repeat
+
+        latencies[question_type] = {"cold_ms": cold / len(ingestor.questions) * 1000,
+                                    "warm_ms": warm / len(ingestor.questions) * 1000}
+
+    print(json.dumps({"load_s": load_time, "memory_mb": memory, "latencies": latencies}))
+
+def run(csv_path, repeat, chunk_rows=None):
+    """Function that measures a file in a new process"""
+    env = {**os.environ, "DATASET_CACHE": "0"}
+    if chunk_rows:
+        env["DATASET_CHUNK_ROWS"] = str(chunk_rows)
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_scaling",
+                             "--measure", csv_path, "--repeat", str(repeat)],
+                            capture_output=True, text=True, check=True, env=env).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--scales", default="1,10", help="scales of the dataset, like 1,10,100")
+    parser.add_argument("--spread", choices=SPREADS, default="years",
+                        help="dimension along which the dataset grows")
+    parser.add_argument("--repeat", type=int, default=20, help="warm calls of each question")
+    parser.add_argument("--chunk-rows", type=int, help="read the file in chunks of this many rows")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.repeat)
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for scale in [float(value) for value in args.scales.split(",")]:
+            csv_path = os.path.join(folder, f"scale_{scale:g}.csv")
+            rows = scale_dataset(args.csv, csv_path, scale, spread=args.spread)
+            results[scale] = {"rows": rows, **run(csv_path, args.repeat, args.chunk_rows)}
+            os.remove(csv_path)
+
+    print(f"{'scale':>6} {'rows':>10} {'load (s)':>10} {'memory (MB)':>12}")
+    for scale, result in results.items():
+        print(f"{scale:6g} {result['rows']:10} {result['load_s']:10.2f} "
+              f"{result['memory_mb']:12.1f}")
+
+    print(f"\n{'type':24}" + "".join(f"{f'x{scale:g} cold':>12}{f'x{scale:g} warm':>12}"
+                                     for scale in results) + "  (ms)")
+    for question_type in QUESTION_TYPES:
+        line = f"{question_type:24}"
+        for result in results.values():
+            latency = result["latencies"][question_type]
+            line += f"{latency['cold_ms']:12.2f}{latency['warm_ms']:12.4f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Startup Benchmark
+
+Measures how long `DataIngestor` takes to load the dataset when it parses
+the CSV file (snapshots disabled), when it parses the CSV file and writes its
+binary snapshot (first start) and when it loads the snapshot (next starts).
+Each load runs in its own process, with the snapshots in a temporary folder.
+
+Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.bench_startup --repeat 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+def measure(csv_path):
+    """Function that loads the dataset and prints how long it took"""
+    # pylint: disable=import-outside-toplevel
+    from app.data_ingestor import DataIngestor
+
+    start = time.perf_counter()
+    DataIngestor(csv_path)
+    print(time.perf_counter() - start)
+
+def run(csv_path, env):
+    """Function that loads the dataset in a new process and returns the time"""
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup",
+                             "--csv", csv_path, "--measure"],
+                            capture_output=True, text=True, check=True,
+                            env={**os.environ, **env}).stdout
+    return float(output.split()[-1])
+
+def main():
+    """Function that runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--repeat", type=int, default=3, help="loads of each kind")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.csv)
+        return
+
+    parse, first, snapshot = [], [], []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {"DATASET_CACHE_DIR": cache_dir}
+            parse.append(run(args.csv, {**env, "DATASET_CACHE": "0"}))
+            first.append(run(args.csv, env))
+            snapshot.append(run(args.csv, env))
+
+    print(f"parse CSV:              {min(parse) * 1000:8.1f} ms")
+    print(f"parse and snapshot:     {min(first) * 1000:8.1f} ms")
+    print(f"load snapshot:          {min(snapshot) * 1000:8.1f} ms  "
+          f"({min(parse) / min(snapshot):.1f}x)")
+
+if __name__ == "__main__":
+    main()
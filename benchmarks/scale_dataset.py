@@ -0,0 +1,116 @@
+"""
+Dataset Scaler
+
+Writes a larger CSV file with the same columns as the dataset, made of
+copies of its rows, so the data ingestor can be measured on 10x or 100x the
+rows. The first copy is the original file. In the other copies each value is
+moved by a random relative amount (--noise, 5% by default) and its
+confidence limits by the same amount, so the means of the groups stay close
+to the real ones. Each copy spreads the data along one dimension:
+
+    years            the years are shifted after the last year of the file
+    locations        the locations get a suffix, so there are more states
+    stratifications  the stratifications get a suffix, so there are more
+                     categories in each state
+
+The copies are written one at a time, so the memory used doesn't grow with
+the size of the output. Run it from the project root, next to the CSV file:
+
+    python -m benchmarks.scale_dataset --scale 10 --output data_x10.csv
+"""
+import argparse
+import math
+import numpy as np
+import pandas as pd
+
+CSV_PATH = "./nutrition_activity_obesity_usa_subset.csv"
+
+SPREADS = ("years", "locations", "stratifications")
+
+# Columns whose values are changed in the copies
+VALUE_COLUMNS = ("Data_Value", "Data_Value_Alt")
+LIMIT_COLUMNS = ("Low_Confidence_Limit", "High_Confidence_Limit")
+
+def read_source(csv_path):
+    """Function that reads every column of the dataset as text"""
+    return pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+
+# Make copy number index of the rows of the dataset
+def make_copy(source, index, spread, noise, rng):
+    """Function that returns a copy of the dataset with moved values"""
+    frame = source.copy()
+    if index == 0:
+        return frame
+
+    values = pd.to_numeric(frame["Data_Value"], errors="coerce")
+    moved = (values * (1 + rng.normal(0, noise, len(frame)))).clip(lower=0)
+    if values.max() <= 100:
+        moved = moved.clip(upper=100)
+    moved = moved.round(1)
+    delta = moved - values
+
+    for column in VALUE_COLUMNS:
+        if column in frame:
+            frame[column] = format_numbers(moved)
+    for column in LIMIT_COLUMNS:
+        if column in frame:
+            limits = pd.to_numeric(frame[column], errors="coerce") + delta
+            frame[column] = format_numbers(limits.round(1))
+
+    if spread == "years":
+        years = pd.to_numeric(source["YearStart"])
+        span = int(years.max() - years.min() + 1)
+        for column in ("YearStart", "YearEnd"):
+            frame[column] = (pd.to_numeric(source[column]) + index * span).astype(str)
+    elif spread == "locations":
+        frame["LocationDesc"] = source["LocationDesc"] + f" #{index}"
+        frame["LocationAbbr"] = source["LocationAbbr"] + str(index)
+    else:
+        frame["Stratification1"] = source["Stratification1"] + f" #{index}"
+
+    return frame
+
+def format_numbers(series):
+    """Function that writes numbers as text, with empty text for NaN"""
+    return series.map(lambda value: "" if pd.isna(value) else f"{value:g}")
+
+# Write rows rows (or scale times the rows of the dataset),
+# the last copy is a random sample of the rows
+def scale_dataset(csv_path, output, scale=None, rows=None, spread="years",
+                  noise=0.05, seed=0):
+    """Function that writes a scaled copy of the dataset and returns its rows"""
+    source = read_source(csv_path)
+    rng = np.random.default_rng(seed)
+    if rows is None:
+        rows = int(round(len(source) * scale))
+
+    written = 0
+    for index in range(math.ceil(rows / len(source))):
+        frame = make_copy(source, index, spread, noise, rng)
+        if rows - written < len(frame):
+            frame = frame.iloc[np.sort(rng.choice(len(frame), rows - written, replace=False))]
+
+        frame.to_csv(output, mode="w" if index == 0 else "a", header=index == 0, index=False)
+        written += len(frame)
+
+    return written
+
+def main():
+    """Function that writes the scaled dataset"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--csv", default=CSV_PATH, help="path of the CSV file")
+    parser.add_argument("--output", required=True, help="path of the scaled CSV file")
+    parser.add_argument("--scale", type=float, default=10, help="times the rows of the file")
+    parser.add_argument("--rows", type=int, help="number of rows, instead of --scale")
+    parser.add_argument("--spread", choices=SPREADS, default="years",
+                        help="dimension along which the copies are spread")
+    parser.add_argument("--noise", type=float, default=0.05, help="relative noise of the values")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the noise")
+    args = parser.parse_args()
+
+    rows = scale_dataset(args.csv, args.output, args.scale, args.rows, args.spread,
+                         args.noise, args.seed)
+    print(f"Wrote {rows} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+Gunicorn Configuration
+
+The application is imported and its dataset loaded once, in the master
+process, before the workers are forked, so the workers share the pages of
+the dataset and of its indexes copy-on-write. Each worker starts its own
+thread pool after the fork.
+
+    gunicorn api_server:webserver
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+
+# Import the application in the master process
+preload_app = True
+
+def when_ready(server): # pylint: disable=unused-argument
+    """Hook that loads the dataset in the master, before the workers are forked"""
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+    webserver.preload()
+
+def post_fork(server, worker): # pylint: disable=unused-argument
+    """Hook that starts the thread pool of a worker"""
+    # pylint: disable=import-outside-toplevel
+    from app import webserver
+    webserver.start()
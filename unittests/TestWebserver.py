@@ -1,7 +1,27 @@
 import unittest
 import json
 import os
-from app import webserver
+import time
+import threading
+import tempfile
+import logging
+from logging.handlers import BufferingHandler
+import pandas as pd
+from app import webserver, Webserver, extra
+from app.result_store import MemoryResultStore
+from app.result_cache import ResultCache, FOLLOWING
+from app.extra import Job
+from app.job_registry import JobRegistry
+from app.job_state import SqliteJobState
+from app.id_allocator import CounterAllocator, RangeAllocator
+from app.task_queue import PriorityTaskQueue
+from app.metrics import Metrics
+from app.data_ingestor import DataIngestor, QUESTION_TYPES, read_csv
+from app.dataset_cache import load_frame, read_snapshot, snapshot_path, write_snapshot
+from app.task_runner import ThreadPool, run_task, fail_task
+from app.executors import LocalExecutor, ProcessExecutor
+from app.dataset_reloader import DatasetReloader
+from app.webserver_logger import AsyncHandler, SamplingFilter
 
 class TestWebserver(unittest.TestCase):
     def setUp(self):
@@ -34,6 +54,610 @@ class TestWebserver(unittest.TestCase):
     def test_state_mean_by_category(self): # test state_mean_by_category
         self.helper("state_mean_by_category")
 
+    def test_result_store_eviction(self): # test the bounds of the memory result store
+        store = MemoryResultStore(max_entries=2, ttl=0.05)
+        store.put_json("job_id_1", "1")
+        store.put_json("job_id_2", "2")
+        store.get_json("job_id_1")
+        store.put_json("job_id_3", "3")
+
+        # job_id_2 was the least recently used one
+        self.assertIsNone(store.get_json("job_id_2"))
+        self.assertEqual(store.get_json("job_id_1"), "1")
+
+        # Both results expire after the time to live
+        time.sleep(0.1)
+        self.assertIsNone(store.get_json("job_id_1"))
+        self.assertIsNone(store.get_json("job_id_3"))
+
+    def test_result_cache_coalescing(self): # test memoization of identical jobs
+        cache = ResultCache(max_entries=8)
+        data = {"question": "Question", "state": "Ohio"}
+        first = Job("best5", "job_id_1", data, None)
+        second = Job("best5", "job_id_2", dict(data, state="Texas"), None)
+        third = Job("state_mean", "job_id_3", data, None)
+
+        # The state doesn't change the answer of best5
+        self.assertEqual(cache.make_key(first), cache.make_key(second))
+        self.assertNotEqual(cache.make_key(first), cache.make_key(third))
+
+        key = cache.make_key(first)
+        self.assertIsNone(cache.lookup(key, first))
+        self.assertIs(cache.lookup(key, second), FOLLOWING)
+        self.assertEqual(cache.complete(key, "{}"), [second])
+        self.assertEqual(cache.lookup(key, third), "{}")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["coalesced"], 1)
+
+    def test_failed_job(self): # test that a failed job fails the jobs waiting for it
+        store = extra.RESULT_STORE
+        extra.RESULT_STORE = MemoryResultStore()
+        self.addCleanup(setattr, extra, "RESULT_STORE", store)
+
+        # The leader has no data ingestor, so computing its answer raises
+        jobs = JobRegistry()
+        cache = ResultCache(max_entries=8)
+        leader = Job("global_mean", "job_id_1", {"question": "Q0"}, None)
+        follower = Job("global_mean", "job_id_2", {"question": "Q0"}, None)
+        for job in (leader, follower):
+            jobs.add(job)
+            job.cache_key = cache.make_key(job)
+        self.assertIsNone(cache.lookup(leader.cache_key, leader))
+        self.assertIs(cache.lookup(follower.cache_key, follower), FOLLOWING)
+
+        self.assertFalse(run_task(leader, jobs, cache, LocalExecutor()))
+        for job in (leader, follower):
+            self.assertEqual(jobs.get(job.job_id).status, "error")
+            result = json.loads(extra.get_result_json(job.job_id))
+            self.assertTrue(result["reason"].startswith("Job failed: "))
+
+        # The failed answer is not cached
+        self.assertIsNone(cache.lookup(leader.cache_key, leader))
+
+    def test_job_registry_retention(self): # test eviction and pages of the job registry
+        registry = JobRegistry(max_jobs=3)
+        for i in range(1, 5):
+            registry.add(Job("global_mean", f"job_id_{i}", {}, None))
+
+        # Running jobs are never evicted
+        self.assertEqual(len(registry), 4)
+
+        registry.mark_done("job_id_2")
+        registry.mark_done("job_id_3")
+        self.assertNotIn("job_id_2", registry)
+        self.assertIn("job_id_3", registry)
+
+        page, has_more = registry.list(status="running", since_id="job_id_1", limit=1)
+        self.assertEqual(page, [{"job_id_4": "running"}])
+        self.assertFalse(has_more)
+
+        # A job added after a job with a later number is still on the next page
+        registry = JobRegistry()
+        for i in (1, 3, 2):
+            registry.add(Job("global_mean", f"job_id_{i}", {}, None))
+        page, has_more = registry.list(limit=2)
+        self.assertEqual(page, [{"job_id_1": "running"}, {"job_id_2": "running"}])
+        self.assertTrue(has_more)
+        self.assertEqual(registry.list(since_id="job_id_2", limit=2),
+                         ([{"job_id_3": "running"}], False))
+
+    def test_shared_job_state(self): # test jobs shared by two registries
+        with tempfile.TemporaryDirectory() as folder:
+            state = SqliteJobState(os.path.join(folder, "jobs.db"))
+            first = JobRegistry(state=state)
+            second = JobRegistry(state=SqliteJobState(state.path))
+
+            job_id = "job_id_" + str(state.reserve())
+            self.assertNotEqual(job_id, "job_id_" + str(second.state.reserve()))
+
+            first.add(Job("global_mean", job_id, {}, None))
+            self.assertIn(job_id, second)
+            self.assertFalse(second.wait(job_id, 0.01))
+
+            state.put_json(job_id, "{}")
+            first.mark_done(job_id)
+            self.assertTrue(second.wait(job_id, 1))
+            self.assertEqual(second.state.get_json(job_id), "{}")
+            self.assertEqual(second.list(), ([{job_id: "done"}], False))
+
+    def test_id_allocation_stress(self): # test unique ids from many threads
+        with tempfile.TemporaryDirectory() as folder:
+            state = SqliteJobState(os.path.join(folder, "jobs.db"))
+
+            # Two range allocators stand for two server processes
+            for allocators in ([CounterAllocator()],
+                               [RangeAllocator(state, block=7), RangeAllocator(state, block=7)]):
+                ids = []
+                barrier = threading.Barrier(16)
+
+                def allocate(allocator):
+                    barrier.wait()
+                    ids.extend([allocator.next_id() for _ in range(500)])
+
+                threads = [threading.Thread(target=allocate, args=(allocators[i % len(allocators)],))
+                           for i in range(16)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+                self.assertEqual(len(ids), 16 * 500)
+                self.assertEqual(len(set(ids)), len(ids))
+
+    def test_priority_queue(self): # test the order of the priority classes
+        queue = PriorityTaskQueue(aging=0.05)
+        queue.put(Job("mean_by_category", "job_id_1", {}, None))
+        queue.put(Job("states_mean", "job_id_2", {}, None))
+        queue.put(Job("global_mean", "job_id_3", {}, None))
+        urgent = Job("mean_by_category", "job_id_4", {}, None)
+        urgent.priority = "high"
+        queue.put(urgent)
+
+        # The shutdown sentinel is served after every task
+        queue.put(None)
+        self.assertEqual([queue.get().job_id for _ in range(3)],
+                         ["job_id_3", "job_id_4", "job_id_2"])
+
+        # An old low priority task goes before a new high priority one
+        time.sleep(0.15)
+        queue.put(Job("global_mean", "job_id_5", {}, None))
+        self.assertEqual(queue.get().job_id, "job_id_1")
+        self.assertEqual(queue.get().job_id, "job_id_5")
+        self.assertIsNone(queue.get())
+        self.assertEqual(queue.class_stats()["low"]["dequeued"], 1)
+
+    def test_metrics_format(self): # test the Prometheus text of the metrics
+        metrics = Metrics()
+        job = Job("best5", "job_id_1", {}, None)
+        job.timings = {"queue_wait": 0.002, "post": 20.0}
+        metrics.observe_job(job, "computed")
+
+        text = metrics.render([("stats_pool_threads", "Task runners", 4)])
+        self.assertIn('stats_jobs_total{type="best5",outcome="computed"} 1\n', text)
+        self.assertIn('stats_job_stage_seconds_bucket{type="best5",stage="queue_wait",'
+                      'le="0.0025"} 1\n', text)
+        self.assertIn('stats_job_stage_seconds_bucket{type="best5",stage="post",'
+                      'le="10.0"} 0\n', text)
+        self.assertIn('stats_job_stage_seconds_bucket{type="best5",stage="post",'
+                      'le="+Inf"} 1\n', text)
+        self.assertIn("# TYPE stats_pool_threads gauge\nstats_pool_threads 4\n", text)
+
+    def test_log_records(self): # test shortened and cut log messages
+        records = BufferingHandler(100)
+        handler = AsyncHandler([records], max_length=200)
+        test_logger = self.make_logger(handler)
+
+        test_logger.info("Got request %s", {"question": "Q" * 5000, "state": "Ohio"})
+        test_logger.info("x" * 5000)
+        handler.close()
+
+        # The argument is shortened by reprlib, the message is cut
+        first, second = [record.getMessage() for record in records.buffer]
+        self.assertLess(len(first), 200)
+        self.assertIn("...", first)
+        self.assertEqual(second, "x" * 200 + "... (5000 characters)")
+
+    def test_log_sampling(self): # test that sampling keeps the errors
+        records = BufferingHandler(100)
+        handler = AsyncHandler([records], max_length=1000)
+        handler.addFilter(SamplingFilter(0))
+        test_logger = self.make_logger(handler)
+
+        for _ in range(10):
+            test_logger.info("Dropped")
+        test_logger.error("Kept")
+        handler.close()
+
+        self.assertEqual([record.getMessage() for record in records.buffer], ["Kept"])
+
+    def test_lazy_initialization(self): # test that creating the app loads nothing
+        threads = threading.active_count()
+        server = Webserver(__name__, csv_path="missing.csv")
+
+        self.assertFalse(server.is_started())
+        self.assertEqual(threading.active_count(), threads)
+
+        # The dataset is loaded when it is first used
+        with self.assertRaises(FileNotFoundError):
+            server.preload()
+
+    def test_chunked_ingestion(self): # test answers from the sums of the chunks
+        rows = [f"Q{i % 2},State{i % 5},Age (years),{18 + i % 3},{i * 1.7 % 11}"
+                for i in range(60)]
+        rows.append("Q0,State0,Sex,Male,")
+
+        full = self.make_ingestor(rows)
+        chunked = self.make_ingestor(rows, chunk_rows=7)
+
+        # The sums of the chunks are added in another order, so the
+        # means can differ in the last digits
+        def rounded(value):
+            if isinstance(value, dict):
+                return {key: rounded(item) for key, item in value.items()}
+            return round(value, 9) + 0.0
+
+        self.assertIsNone(chunked.csv_data)
+        self.assertEqual(chunked.questions, full.questions)
+        for question in ["Q0", "Q1", "Q2"]:
+            for question_type in QUESTION_TYPES:
+                data = {"question": question, "state": "State0"}
+                expected = full.answer_question(data, question_type)
+                result = chunked.answer_question(data, question_type)
+                self.assertEqual(json.dumps(rounded(result)), json.dumps(rounded(expected)))
+
+    def test_dataset_snapshot(self): # test the binary snapshot of the dataset
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        csv_path = os.path.join(folder.name, "data.csv")
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("Question,LocationDesc,StratificationCategory1,Stratification1,Data_Value\n"
+                       "Q0,State0,Sex,Male,1.5\nQ1,State1,Sex,Female,\nQ0,State1,Sex,Male,3\n")
+
+        # The snapshot is read back as the same frame
+        frame = read_csv(csv_path)
+        path = snapshot_path(csv_path)
+        write_snapshot(frame, path)
+        pd.testing.assert_frame_equal(read_snapshot(path), frame)
+
+        parsed = []
+        def counting_read_csv(csv_path):
+            parsed.append(csv_path)
+            return read_csv(csv_path)
+
+        pd.testing.assert_frame_equal(load_frame(csv_path, counting_read_csv), frame)
+        self.assertEqual(len(parsed), 0)
+
+        # A new modification time or size parses the file again
+        # and removes the snapshot of the old file
+        os.utime(csv_path, ns=(0, os.stat(csv_path).st_mtime_ns + 10 ** 9))
+        load_frame(csv_path, counting_read_csv)
+        self.assertEqual(len(parsed), 1)
+        self.assertFalse(os.path.exists(path))
+
+        with open(csv_path, "a", encoding="utf-8") as file:
+            file.write("Q1,State0,Sex,Female,4\n")
+        self.assertEqual(len(load_frame(csv_path, counting_read_csv)), 4)
+        self.assertEqual(len(parsed), 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(path))), 1)
+
+        # A corrupt snapshot falls back to parsing the file
+        with open(os.path.join(snapshot_path(csv_path), "categories.json"), "w",
+                  encoding="utf-8") as file:
+            file.write("{")
+        pd.testing.assert_frame_equal(load_frame(csv_path, counting_read_csv),
+                                      read_csv(csv_path))
+        self.assertEqual(len(parsed), 3)
+
+    def test_append_rows(self): # test appending rows to a loaded dataset
+        rows = [f"Q{i % 2},State{i % 3},Sex,Male,{i}" for i in range(12)]
+        new_rows = [{"Question": "Q0", "LocationDesc": "State3", "StratificationCategory1": "Sex",
+                     "Stratification1": "Male", "Data_Value": 10},
+                    {"Question": "Q0", "LocationDesc": "State0", "StratificationCategory1": "Sex",
+                     "Stratification1": "Male", "Data_Value": "4.5"}]
+        ingestor = self.make_ingestor(rows)
+
+        ingestor.get_index("Q0")
+        appended, questions = ingestor.append(new_rows)
+        self.assertEqual(questions, ["Q0"])
+
+        # Only the version of the changed question is new
+        self.assertEqual(appended.question_version("Q1"), ingestor.question_version("Q1"))
+        self.assertEqual(appended.question_version("Q0"), appended.version)
+        self.assertEqual(appended.answer_question({"question": "Q0"}, "states_mean"),
+                         {"State0": 3.5, "State2": 5.0, "State1": 7.0, "State3": 10.0})
+        self.assertEqual(appended.answer_question({"question": "Q0"}, "global_mean"),
+                         {"global_mean": 5.5625})
+
+        # The old data ingestor, still used by running jobs, is not changed
+        self.assertEqual(ingestor.answer_question({"question": "Q0"}, "global_mean"),
+                         {"global_mean": 5.0})
+        self.assertEqual(ingestor.question_version("Q0"), ingestor.version)
+
+        with self.assertRaises(ValueError):
+            ingestor.append([{"Question": "Q0", "Data_Value": 1}])
+
+        # Rows whose text fields are missing or not strings are rejected
+        for question in (None, "", {"a": 1}, 1):
+            with self.assertRaises(ValueError):
+                ingestor.append([dict(new_rows[0], Question=question)])
+
+    def test_top_k(self): # test the rankings of the states
+        question = "Percent of adults who engage in no leisure-time physical activity"
+        rows = [f"{question},State{i},Sex,Male,{(i * 7) % 10}" for i in range(10)]
+        ingestor = self.make_ingestor(rows)
+
+        # The lowest means are the best for this question
+        best = ingestor.answer_question({"question": question, "k": 3}, "top_k")
+        self.assertEqual(list(best), ["State0", "State3", "State6"])
+        worst = ingestor.answer_question({"question": question, "k": 2, "order": "worst"},
+                                         "top_k")
+        self.assertEqual(worst, {"State7": 9.0, "State4": 8.0})
+
+        self.assertEqual(ingestor.answer_question({"question": question}, "top_k"),
+                         ingestor.answer_question({"question": question}, "best5"))
+        self.assertEqual(len(ingestor.answer_question({"question": question, "k": 50},
+                                                      "top_k")), 10)
+
+        # Jobs with another k don't share their answer
+        first = Job("top_k", "job_id_1", {"question": question, "k": 3}, ingestor)
+        second = Job("top_k", "job_id_2", {"question": question, "k": 4}, ingestor)
+        self.assertNotEqual(ResultCache.make_key(first), ResultCache.make_key(second))
+
+    def test_queue_full(self): # test the rejection of jobs when the queue is full
+        os.environ["TP_QUEUE_CAPACITY"] = "1"
+        os.environ["TP_RETRY_AFTER"] = "3"
+        try:
+            tasks_runner = ThreadPool()
+        finally:
+            del os.environ["TP_QUEUE_CAPACITY"]
+            del os.environ["TP_RETRY_AFTER"]
+
+        # The task runners are not started yet, so the first job stays queued
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1"]), tasks_runner)
+        first = client.post("/api/states_mean", json={"question": "Q0"})
+        self.assertEqual(first.status_code, 200)
+        rejected = client.post("/api/global_mean", json={"question": "Q0"})
+        self.assertEqual(rejected.status_code, 429)
+        self.assertEqual(rejected.headers["Retry-After"], "3")
+        self.assertEqual(rejected.get_json()["retry_after"], 3)
+
+        num_jobs = client.get("/api/num_jobs").get_json()
+        self.assertEqual(num_jobs["queue_depth"], 1)
+        self.assertEqual(num_jobs["queue_capacity"], 1)
+        self.assertEqual(num_jobs["classes"]["normal"]["depth"], 1)
+
+        # The queued job is done once the task runners start
+        tasks_runner.start()
+        job_id = first.get_json()["job_id"]
+        result = client.get(f"/api/get_results/{job_id}?wait=5").get_json()
+        self.assertEqual(result, {"status": "done", "data": {"State0": 1.0}})
+
+    def test_wait_for_results(self): # test get_results with ?wait=
+        tasks_runner = ThreadPool()
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1"]), tasks_runner)
+        job_id = client.post("/api/global_mean", json={"question": "Q0"}).get_json()["job_id"]
+
+        # The task runners are not started, so the wait times out
+        start = time.monotonic()
+        result = client.get(f"/api/get_results/{job_id}?wait=0.1").get_json()
+        self.assertEqual(result, {"status": "running"})
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        # A longer wait is cut to RESULTS_MAX_WAIT
+        self.webserver_attribute("results_max_wait", 0.2)
+        start = time.monotonic()
+        result = client.get(f"/api/get_results/{job_id}?wait=30").get_json()
+        self.assertEqual(result, {"status": "running"})
+        self.assertLess(time.monotonic() - start, 5)
+
+        # The wait ends as soon as the job is done
+        webserver.results_max_wait = 30
+        threading.Timer(0.1, tasks_runner.start).start()
+        start = time.monotonic()
+        result = client.get(f"/api/get_results/{job_id}?wait=30").get_json()
+        self.assertEqual(result, {"status": "done", "data": {"global_mean": 1.0}})
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_fast_path(self): # test answers computed in the request thread
+        ingestor = self.make_ingestor(["Q0,State0,Sex,Male,1", "Q1,State0,Sex,Male,2"])
+        ingestor.get_index("Q0")
+        tasks_runner = ThreadPool()
+        client = self.serve(ingestor, tasks_runner)
+
+        # The task runners are not started, so only the fast path can answer
+        self.webserver_attribute("fast_path", True)
+        result = client.post("/api/global_mean?inline=1", json={"question": "Q0"}).get_json()
+        self.assertEqual(result["status"], "done")
+        self.assertEqual(result["data"], {"global_mean": 1.0})
+        self.assertEqual(client.get("/api/num_jobs").get_json()["queue_depth"], 0)
+
+        # A question without an index and any job without the fast path are queued
+        client.post("/api/global_mean?inline=1", json={"question": "Q1"})
+        webserver.fast_path = False
+        job_id = client.post("/api/states_mean?inline=1",
+                             json={"question": "Q0"}).get_json()["job_id"]
+        self.assertEqual(client.get("/api/num_jobs").get_json()["queue_depth"], 2)
+
+        tasks_runner.start()
+        result = client.get(f"/api/get_results/{job_id}?wait=5").get_json()
+        self.assertEqual(result, {"status": "done", "data": {"State0": 1.0}})
+
+    def test_stream_events(self): # test streams of the results of given jobs
+        ingestor = self.make_ingestor(["Q0,State0,Sex,Male,1", "Q1,State0,Sex,Male,2"])
+        ingestor.get_index("Q0")
+        tasks_runner = ThreadPool()
+        client = self.serve(ingestor, tasks_runner)
+
+        # The first job is answered by the fast path, the second one is
+        # queued until the task runners start
+        self.webserver_attribute("fast_path", True)
+        queued = client.post("/api/global_mean", json={"question": "Q1"}).get_json()["job_id"]
+        done = client.post("/api/global_mean", json={"question": "Q0"}).get_json()["job_id"]
+
+        threading.Timer(0.1, tasks_runner.start).start()
+        response = client.get(f"/api/stream?job_ids={queued},{done}")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = [json.loads(event[len("data: "):])
+                  for event in response.get_data(as_text=True).split("\n\n")
+                  if event.startswith("data: ")]
+
+        # The finished job comes first and the stream ends after the last job
+        self.assertEqual(events, [
+            {"data": {"global_mean": 1.0}, "job_id": done, "status": "done"},
+            {"data": {"global_mean": 2.0}, "job_id": queued, "status": "done"}])
+
+        response = client.post("/api/stream?format=ndjson", json={"job_ids": [done]})
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertEqual(response.get_data(as_text=True).splitlines(),
+                         ['{"data": {"global_mean": 1.0}, "job_id": "' + done
+                          + '", "status": "done"}'])
+
+    def test_stream_errors(self): # test the error events of a stream
+        tasks_runner = ThreadPool()
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1"]), tasks_runner)
+        tasks_runner.start()
+
+        failed = Job("global_mean", "job_id_1", {"question": "Q0"}, None)
+        tasks_runner.jobs.add(failed)
+        fail_task(failed, "Job failed: test", tasks_runner.jobs)
+
+        response = client.post("/api/stream?format=ndjson",
+                               json={"job_ids": ["job_id_1", "job_id_9"]})
+        self.assertEqual([json.loads(line) for line in response.get_data(as_text=True).split("\n")
+                          if line], [
+            {"job_id": "job_id_1", "reason": "Job failed: test", "status": "error"},
+            {"job_id": "job_id_9", "reason": "Invalid job_id", "status": "error"}])
+
+        for body in ({"job_ids": [["job_id_1"]]}, {"job_ids": "job_id_1"}, [1]):
+            self.assertEqual(client.post("/api/stream", json=body).get_json(),
+                             {"status": "error", "reason": "Invalid job_ids"})
+
+    def test_admin_routes(self): # test the admin routes and the paths they accept
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        with open(os.path.join(folder.name, "new.csv"), "w", encoding="utf-8") as file:
+            file.write("Question,LocationDesc,StratificationCategory1,Stratification1,Data_Value\n"
+                       "Q0,State0,Sex,Male,2\n")
+
+        os.environ["DATASET_DIR"] = folder.name
+        try:
+            reloader = DatasetReloader(webserver)
+        finally:
+            del os.environ["DATASET_DIR"]
+
+        tasks_runner = ThreadPool()
+        tasks_runner.start()
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1"]), tasks_runner)
+        self.webserver_attribute("dataset_reloader", reloader)
+        self.webserver_attribute("admin_routes", False)
+
+        for method, route in (("post", "/api/admin/reload"), ("post", "/api/admin/append"),
+                              ("get", "/api/admin/dataset")):
+            response = getattr(client, method)(route, json={})
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(response.get_json()["reason"], "Admin routes disabled")
+
+        # Only the files of the data folder can be named
+        webserver.admin_routes = True
+        self.assertEqual(reloader.resolve_path("new.csv"),
+                         os.path.join(os.path.realpath(folder.name), "new.csv"))
+        for path in ("../new.csv", "missing.csv", os.path.abspath(__file__)):
+            with self.assertRaises(ValueError):
+                reloader.resolve_path(path)
+            for route in ("/api/admin/reload", "/api/admin/append"):
+                self.assertEqual(client.post(route, json={"path": path}).get_json(),
+                                 {"status": "error", "reason": "Invalid path"})
+
+        # A second reload can't start while one is loading
+        reloader.state = "loading"
+        self.assertEqual(client.post("/api/admin/reload", json={}).get_json()["reason"],
+                         "Reload in progress")
+        reloader.state = "idle"
+
+    def test_reload_dataset(self): # test jobs and cached answers across a reload
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        csv_path = os.path.join(folder.name, "new.csv")
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("Question,LocationDesc,StratificationCategory1,Stratification1,Data_Value\n"
+                       "Q0,State0,Sex,Male,2\n")
+
+        tasks_runner = ThreadPool()
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1"]), tasks_runner)
+        reloader = DatasetReloader(webserver)
+        self.webserver_attribute("dataset_reloader", reloader)
+
+        # The job is created before the reload and computed after it
+        old_job = client.post("/api/global_mean", json={"question": "Q0"}).get_json()["job_id"]
+        self.assertTrue(reloader.reload(csv_path))
+        for _ in range(100):
+            if reloader.status()["state"] != "loading":
+                break
+            time.sleep(0.05)
+        self.assertEqual(reloader.status()["state"], "idle")
+        self.assertEqual(webserver.data_ingestor.csv_path, csv_path)
+
+        tasks_runner.start()
+        result = client.get(f"/api/get_results/{old_job}?wait=5").get_json()
+        self.assertEqual(result["data"], {"global_mean": 1.0})
+
+        # The answer of the old dataset is cached, but not returned for the new one
+        new_job = client.post("/api/global_mean", json={"question": "Q0"}).get_json()["job_id"]
+        result = client.get(f"/api/get_results/{new_job}?wait=5").get_json()
+        self.assertEqual(result["data"], {"global_mean": 2.0})
+
+    def test_batch(self): # test answering a list of questions in a single job
+        tasks_runner = ThreadPool()
+        tasks_runner.start()
+        client = self.serve(self.make_ingestor(["Q0,State0,Sex,Male,1", "Q0,State1,Sex,Male,3",
+                                                "Q1,State0,Sex,Male,2"]), tasks_runner)
+        self.webserver_attribute("batch_max_items", 3)
+
+        items = [{"type": "state_mean", "question": "Q0", "state": "State1"},
+                 {"type": "global_mean", "question": "Q1"},
+                 {"type": "top_k", "question": "Q0", "k": 1, "order": "worst"}]
+        expected = [{"type": "state_mean", "question": "Q0", "state": "State1",
+                     "data": {"State1": 3.0}},
+                    {"type": "global_mean", "question": "Q1", "state": None,
+                     "data": {"global_mean": 2.0}},
+                    {"type": "top_k", "question": "Q0", "state": None,
+                     "data": {"State0": 1.0}}]
+
+        # The body is the list of items or has them in "items"
+        for body in (items, {"items": items}):
+            job_id = client.post("/api/batch", json=body).get_json()["job_id"]
+            result = client.get(f"/api/get_results/{job_id}?wait=5").get_json()
+            self.assertEqual(result, {"status": "done", "data": expected})
+
+        # Items that can't be answered reject the whole batch
+        for body in ([], items + items[:1], [{"type": "median", "question": "Q0"}],
+                     [{"type": "state_mean", "question": "Q0"}],
+                     [{"type": "top_k", "question": "Q0", "k": 0}],
+                     [{"type": "top_k", "question": "Q0", "k": "3"}], {"items": "Q0"}):
+            self.assertEqual(client.post("/api/batch", json=body).get_json(),
+                             {"status": "error", "reason": "Invalid batch"})
+
+    def test_process_executor(self): # test answers computed by worker processes
+        os.environ["TP_NUM_OF_THREADS"] = "1"
+        os.environ["TP_EXECUTOR"] = "processes"
+        try:
+            tasks_runner = ThreadPool()
+        finally:
+            del os.environ["TP_NUM_OF_THREADS"]
+            del os.environ["TP_EXECUTOR"]
+        executor = tasks_runner.executor
+        self.assertIsInstance(executor, ProcessExecutor)
+
+        old = self.make_ingestor(["Q0,State0,Sex,Male,1", "Q0,State1,Age (years),18 - 24,5"])
+        new = self.make_ingestor(["Q0,State0,Sex,Male,2"])
+        try:
+            for question_type in QUESTION_TYPES:
+                job = Job(question_type, "job_id_1", {"question": "Q0", "state": "State0"}, old)
+                self.assertEqual(executor.run(job), LocalExecutor().run(job))
+
+            # After a task of a newer file, the workers have the new dataset,
+            # so a task of the old one is computed here with the old one
+            job = Job("global_mean", "job_id_2", {"question": "Q0"}, new)
+            self.assertEqual(json.loads(executor.run(job)), {"global_mean": 2.0})
+            job = Job("global_mean", "job_id_3", {"question": "Q0"}, old)
+            self.assertEqual(json.loads(executor.run(job)), {"global_mean": 3.0})
+
+            worker = executor.pool.submit(os.getpid).result()
+        finally:
+            tasks_runner.start()
+            tasks_runner.shutdown()
+
+        # The workers stop with the executor
+        self.assertIsNone(executor.pool)
+        for _ in range(100):
+            try:
+                os.kill(worker, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail("The worker process is still running")
+
     # Helper method used for getting data from input file
     # answering the question and comparing the result with the data
     # from output file
@@ -59,5 +683,51 @@ class TestWebserver(unittest.TestCase):
             # Compare result of answer_question to the data from output file
             self.assertEqual(result, expected_result, f"Failed for input file: {input_file}")
 
+    # Helper method used for serving the requests of a test with the
+    # given dataset and thread pool, and an empty result store since the
+    # job ids of every thread pool start from 1. The ones of the server
+    # are set back after the test. The thread pool is shut down after the
+    # test, so the test has to start its task runners
+    def serve(self, ingestor, tasks_runner):
+        saved = (webserver._data_ingestor, webserver._tasks_runner, extra.RESULT_STORE)
+        webserver._data_ingestor = ingestor
+        webserver._tasks_runner = tasks_runner
+        extra.RESULT_STORE = MemoryResultStore()
+
+        def restore():
+            tasks_runner.shutdown()
+            webserver._data_ingestor, webserver._tasks_runner, extra.RESULT_STORE = saved
+
+        self.addCleanup(restore)
+        return webserver.test_client()
+
+    # Helper method used for changing an attribute of the server
+    # during a test, it is set back after the test
+    def webserver_attribute(self, name, value):
+        self.addCleanup(setattr, webserver, name, getattr(webserver, name))
+        setattr(webserver, name, value)
+
+    # Helper method used for getting a logger whose records only
+    # go to the given handler, the handler is removed after the test
+    def make_logger(self, handler):
+        test_logger = logging.getLogger(f"unittests.{self.id()}")
+        test_logger.propagate = False
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        return test_logger
+
+    # Helper method used for loading a small dataset: the rows are
+    # written after the header into a temporary CSV file, which is kept
+    # until the end of the test, so worker processes can load it too
+    def make_ingestor(self, rows, chunk_rows=None):
+        header = "Question,LocationDesc,StratificationCategory1,Stratification1,Data_Value"
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+
+        csv_path = os.path.join(folder.name, "data.csv")
+        with open(csv_path, "w", encoding="utf-8") as file:
+            file.write("\n".join([header] + rows) + "\n")
+        return DataIngestor(csv_path, chunk_rows=chunk_rows)
+
 if __name__ == "__main__":
     unittest.main()